@@ -0,0 +1,203 @@
+"""Benchmark the overhead of CliRunner.invoke itself.
+
+Each scenario times complete `CliRunner.invoke` calls of a trivial command,
+so the numbers are the cost of the harness: building the stream wrappers,
+patching the environment, splitting arguments and copying the output.  The
+``import`` scenario times ``from clirunner import CliRunner`` in a fresh
+interpreter, as paid by every pytest worker.
+
+Run with `doit bench` to compare against `benchmarks/baseline.json`, or:
+
+    python benchmarks/bench_invoke.py [--save FILE] [--compare FILE]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import typing as t
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from clirunner import CliRunner  # noqa: E402
+
+LARGE = 8 * 1024 * 1024
+
+
+def noop() -> None:
+    pass
+
+
+def write_large() -> None:
+    line = "x" * 1023 + "\n"
+    for _ in range(LARGE // len(line)):
+        sys.stdout.write(line)
+
+
+def read_all() -> None:
+    sys.stdin.read()
+
+
+def read_lines() -> None:
+    for _ in sys.stdin:
+        pass
+
+
+def count_env() -> None:
+    print(len(os.environ))
+
+
+LARGE_INPUT = "y" * 1023 + "\n"
+MANY_ENV = {f"CLIRUNNER_BENCH_{i}": str(i) for i in range(500)}
+
+# runner options, command, invoke arguments and invocations per repeat
+Scenario = t.Tuple[
+    t.Dict[str, t.Any], t.Callable[[], None], t.Dict[str, t.Any], int
+]
+
+SCENARIOS: dict[str, Scenario] = {
+    "noop": ({}, noop, {}, 2000),
+    "noop_string_args": ({}, noop, {"args": "--name 'Peter Pan' -v -v"}, 2000),
+    "large_output": ({}, write_large, {}, 5),
+    "large_input": ({}, read_all, {"input": LARGE_INPUT * (LARGE // 1024)}, 10),
+    "echo_stdin": (
+        {"echo_stdin": True},
+        read_lines,
+        {"input": LARGE_INPUT * 1024},
+        50,
+    ),
+    "many_env_vars": ({}, count_env, {"env": MANY_ENV}, 500),
+}
+
+
+IMPORT_ITERATIONS = 20
+
+
+def import_time() -> float:
+    """Return the seconds taken to import CliRunner in a new interpreter,
+    with its bytecode cached as for an installed package.
+    """
+    env = {k: v for k, v in os.environ.items() if k != "PYTHONDONTWRITEBYTECODE"}
+    code = (
+        "import time\n"
+        "start = time.perf_counter()\n"
+        "from clirunner import CliRunner\n"
+        "print(time.perf_counter() - start)\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=os.path.join(os.path.dirname(__file__), os.pardir),
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return float(output)
+
+
+ALL = ["import", *SCENARIOS]
+
+
+def run(name: str, repeat: int) -> dict[str, float]:
+    """Time a scenario; return seconds per invocation."""
+    if name == "import":
+        times = [
+            statistics.median(import_time() for _ in range(IMPORT_ITERATIONS))
+            for _ in range(repeat)
+        ]
+        return {"min": min(times), "median": statistics.median(times)}
+    options, cli, kwargs, iterations = SCENARIOS[name]
+    runner = CliRunner(**options)
+    runner.invoke(cli, **kwargs)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            runner.invoke(cli, **kwargs)
+        times.append((time.perf_counter() - start) / iterations)
+    return {"min": min(times), "median": statistics.median(times)}
+
+
+def compare(
+    results: dict[str, dict[str, float]],
+    baseline: dict[str, t.Any],
+    threshold: float,
+) -> list[str]:
+    """Return a message for every scenario whose minimum time regressed by
+    more than `threshold` relative to `baseline`.
+    """
+    regressions = []
+    for name, stats in results.items():
+        expected = baseline["results"].get(name)
+        if expected is None:
+            continue
+        change = stats["min"] / expected["min"] - 1
+        if change > threshold:
+            regressions.append(
+                f"{name}: {stats['min'] * 1e6:.1f}us vs"
+                f" {expected['min'] * 1e6:.1f}us (+{change:.0%})"
+            )
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "scenarios",
+        nargs="*",
+        help=f"scenarios to run (default: all of {', '.join(ALL)})",
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--save", metavar="FILE", help="write results as baseline")
+    parser.add_argument("--compare", metavar="FILE", help="baseline to compare to")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="relative slowdown reported as a regression (default: 0.25)",
+    )
+    args = parser.parse_args()
+    for name in args.scenarios:
+        if name not in ALL:
+            parser.error(f"unknown scenario {name!r}")
+
+    environment = {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "system": platform.system(),
+    }
+    results = {}
+    for name in args.scenarios or ALL:
+        results[name] = run(name, args.repeat)
+        print(
+            f"{name:20} min {results[name]['min'] * 1e6:12.1f}us"
+            f"  median {results[name]['median'] * 1e6:12.1f}us"
+        )
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"environment": environment, "results": results}, f, indent=2)
+            f.write("\n")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("environment") != environment:
+            print(f"warning: baseline was recorded on {baseline.get('environment')}")
+        regressions = compare(results, baseline, args.threshold)
+        for message in regressions:
+            print(f"regression: {message}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
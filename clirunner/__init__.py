@@ -1,6 +1,48 @@
 """CliRunner test runner for command line applications."""
 
+from __future__ import annotations
+
+import importlib
+import typing as t
+
 from ._version import __version__
-from .testing import CliRunner
 
-__all__ = ["CliRunner", "__version__"]
+if t.TYPE_CHECKING:
+    from ._cache import DiskResultCache, ResultCache
+    from .testing import CliRunner, FileInput
+
+__all__ = [
+    "CliRunner",
+    "DiskResultCache",
+    "FileInput",
+    "ResultCache",
+    "__version__",
+]
+
+# public names and the submodules defining them, imported on first access so
+# that importing the package does not import more than is used
+_LAZY = {
+    "CliRunner": ".testing",
+    "DiskResultCache": "._cache",
+    "FileInput": ".testing",
+    "ResultCache": "._cache",
+}
+
+# public submodules, imported on first access as attributes of the package
+_SUBMODULES = {"exceptions", "testing", "utils"}
+
+
+def __getattr__(name: str) -> t.Any:
+    if name in _SUBMODULES:
+        return importlib.import_module(f".{name}", __name__)
+    try:
+        module = _LAZY[name]
+    except KeyError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted({*globals(), *__all__, *_SUBMODULES})
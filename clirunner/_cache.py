@@ -0,0 +1,490 @@
+"""Caching of invocation results for `CliRunner(cache=...)`.
+
+A cache key identifies everything that determines the result of invoking a
+deterministic CLI: the callable, its arguments, the data on `<stdin>` and the
+environment.  In memory, functions are identified by their module, qualified
+name and a digest of their code and defaults, so an edited function never
+hits a stale entry.  Other callables, and functions with closures, are
+identified by the object itself.
+
+On disk, callables are identified by their module and qualified name and by
+the source of their module and of the modules it imports, found from the
+import statements anywhere in the source, so results survive across
+processes until the code under test changes.
+"""
+
+from __future__ import annotations
+
+import ast
+import collections
+import collections.abc as cabc
+import contextlib
+import copy
+import hashlib
+import importlib.machinery
+import inspect
+import marshal
+import os
+import pickle
+import shutil
+import sys
+import sysconfig
+import tempfile
+import threading
+import types
+import typing as t
+
+from . import utils
+from ._version import __version__
+
+_MISSING = object()
+
+# directories holding the standard library and installed packages, whose
+# modules are identified by file size and modification time
+_INSTALLED_PATHS = tuple(
+    os.path.join(os.path.normcase(os.path.realpath(path)), "")
+    for name, path in sysconfig.get_paths().items()
+    if name in ("stdlib", "platstdlib", "purelib", "platlib")
+)
+
+# file digests by path, with the size and modification time they were made for
+_file_digests: dict[str, tuple[int, int, str]] = {}
+
+# the import statements of source files by path, with the digest they were
+# parsed for, as (level, module, names) tuples
+_file_imports: dict[str, tuple[str, list[tuple[int, str, list[str]]]]] = {}
+
+
+def _code_digest(code: types.CodeType) -> str:
+    return hashlib.sha256(marshal.dumps(code)).hexdigest()
+
+
+def callable_key(cli: t.Callable[..., t.Any]) -> t.Hashable:
+    """Return the part of the cache key identifying `cli`.
+
+    Raises:
+        TypeError: if `cli` cannot be cached.
+    """
+    if isinstance(cli, types.FunctionType) and cli.__closure__ is None:
+        return (
+            cli.__module__,
+            cli.__qualname__,
+            _code_digest(cli.__code__),
+            repr(cli.__defaults__),
+            repr(cli.__kwdefaults__),
+        )
+    hash(cli)
+    return cli
+
+
+def input_key(input: t.Any, charset: str) -> t.Hashable:
+    """Return a digest of `input`.
+
+    Raises:
+        TypeError: if `input` is a stream, file or iterable which cannot be
+            read without consuming it.
+    """
+    if input is None:
+        return ""
+    if isinstance(input, str):
+        input = input.encode(charset)
+    if isinstance(input, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(input).hexdigest()
+    raise TypeError(f"cannot cache input of type {type(input).__name__}")
+
+
+def hashable(value: t.Any) -> t.Hashable:
+    """Return `value` as a hashable cache key part.
+
+    Raises:
+        TypeError: if `value` is not hashable.
+    """
+    if isinstance(value, (list, tuple)):
+        return tuple(hashable(item) for item in value)
+    if isinstance(value, os.PathLike):
+        return t.cast(t.Hashable, os.fspath(value))
+    hash(value)
+    return t.cast(t.Hashable, value)
+
+
+def _file_digest(path: str) -> str:
+    stat = os.stat(path)
+    cached = _file_digests.get(path)
+    if cached is not None and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+        return cached[2]
+    with open(path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    _file_digests[path] = (stat.st_size, stat.st_mtime_ns, digest)
+    return digest
+
+
+def _imports(path: str, digest: str) -> list[tuple[int, str, list[str]]]:
+    cached = _file_imports.get(path)
+    if cached is not None and cached[0] == digest:
+        return cached[1]
+    imports: list[tuple[int, str, list[str]]] = []
+    try:
+        with open(path, "rb") as f:
+            tree = ast.parse(f.read(), path)
+    except (SyntaxError, ValueError):
+        tree = ast.Module(body=[], type_ignores=[])
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            imports.extend((0, alias.name, []) for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            names = [alias.name for alias in node.names if alias.name != "*"]
+            imports.append((node.level, node.module or "", names))
+    _file_imports[path] = (digest, imports)
+    return imports
+
+
+def _dependencies(name: str, path: str, digest: str) -> cabc.Iterator[str]:
+    """Yield the names of the modules imported anywhere in the source of the
+    module `name` at `path`, including inside functions, with the modules
+    names may be imported from and the packages containing them.
+    """
+    is_package = os.path.splitext(os.path.basename(path))[0] == "__init__"
+    package = name if is_package else name.rpartition(".")[0]
+    for level, module, names in _imports(path, digest):
+        if level:
+            parts = package.split(".") if package else []
+            if level - 1 >= len(parts):
+                # beyond the top-level package
+                continue
+            base = ".".join(parts[: len(parts) - level + 1])
+            module = f"{base}.{module}" if module else base
+        parts = module.split(".")
+        for i in range(1, len(parts) + 1):
+            yield ".".join(parts[:i])
+        # the names may be submodules
+        for imported in names:
+            yield f"{module}.{imported}"
+
+
+def _locate(name: str) -> tuple[str | None, list[str] | None]:
+    """Return the file of the module `name` and the directories of its
+    submodules, without importing it.
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        search = getattr(module, "__path__", None)
+        path = getattr(module, "__file__", None)
+        return path, None if search is None else list(search)
+    parent = name.rpartition(".")[0]
+    search = None
+    if parent:
+        search = _locate(parent)[1]
+        if search is None:
+            return None, None
+    try:
+        spec = importlib.machinery.PathFinder.find_spec(name, search)
+    except (ImportError, ValueError):
+        return None, None
+    if spec is None:
+        return None, None
+    return spec.origin if spec.has_location else None, spec.submodule_search_locations
+
+
+def source_digest(module_name: str) -> str:
+    """Return a digest of the source of a module and of the modules it imports,
+    transitively.
+
+    Imports are found in the source, so modules imported inside functions
+    which have not run yet are included.  Modules of the standard library and
+    of installed packages are identified by the size and modification time of
+    their file and are not followed.
+    """
+    seen: set[str] = set()
+    parts = []
+    pending = [module_name]
+    while pending:
+        name = pending.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+        path = _locate(name)[0]
+        if not path:
+            parts.append((name, ""))
+            continue
+        real = os.path.normcase(os.path.realpath(path))
+        if real.startswith(_INSTALLED_PATHS):
+            stat = os.stat(real)
+            parts.append((name, f"{stat.st_size}:{stat.st_mtime_ns}"))
+            continue
+        digest = _file_digest(real)
+        parts.append((name, digest))
+        if real.endswith(".py"):
+            pending.extend(_dependencies(name, real, digest))
+    return hashlib.sha256(repr(sorted(parts)).encode()).hexdigest()
+
+
+def source_key(cli: t.Callable[..., t.Any]) -> t.Hashable:
+    """Return the part of a persistent cache key identifying `cli`.
+
+    Raises:
+        TypeError: if the module of `cli` cannot be determined.
+    """
+    if inspect.isroutine(cli) or inspect.isclass(cli):
+        target: t.Any = inspect.unwrap(cli)
+    else:
+        # an instance, such as a Click command wrapping a callback
+        target = getattr(cli, "callback", None) or type(cli)
+    module = getattr(target, "__module__", None)
+    qualname = getattr(target, "__qualname__", None)
+    if not isinstance(module, str) or not isinstance(qualname, str):
+        raise TypeError(f"cannot cache {cli!r}")
+    if "<locals>" in qualname:
+        raise TypeError(f"cannot persist results of local function {qualname}")
+    return (module, qualname, source_digest(module))
+
+
+def tree_digest(directory: str) -> str:
+    """Return a digest of the names and contents of all files below
+    `directory`.
+    """
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            name = os.path.relpath(path, directory)
+            digest.update(name.encode("utf-8", "surrogateescape"))
+            digest.update(b"\0")
+            digest.update(_file_digest(path).encode())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """A thread-safe least recently used cache of invocation results, shared
+    by the runners created with it.
+
+    Args:
+        maxsize: the maximum number of results kept.
+        max_bytes: the maximum number of bytes of captured output kept.
+            Results with more output than this are never cached.
+    """
+
+    def __init__(self, maxsize: int = 256, max_bytes: int = 64 * 1024 * 1024) -> None:
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        #: The number of lookups which found a result.
+        self.hits = 0
+        #: The number of lookups which found no result.
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries: collections.OrderedDict[t.Hashable, tuple[t.Any, int]] = (
+            collections.OrderedDict()
+        )
+        self._nbytes = 0
+
+    #: Whether keys include the files of the current `isolated_filesystem`.
+    include_files = False
+
+    def callable_key(self, cli: t.Callable[..., t.Any]) -> t.Hashable:
+        """Return the part of the cache key identifying `cli`.
+
+        Raises:
+            TypeError: if `cli` cannot be cached.
+        """
+        return callable_key(cli)
+
+    def get(self, key: t.Hashable) -> t.Any | None:
+        """Return the result cached for `key` or `None`."""
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return t.cast("tuple[t.Any, int]", entry)[0]
+
+    def put(self, key: t.Hashable, result: t.Any, size: int) -> None:
+        """Cache `result` for `key`, evicting the least recently used results
+        to stay within `maxsize` and `max_bytes`.
+        """
+        if size > self.max_bytes or self.maxsize <= 0:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._nbytes -= old[1]
+            self._entries[key] = (result, size)
+            self._nbytes += size
+            while len(self._entries) > self.maxsize or self._nbytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._nbytes -= evicted
+
+    def clear(self) -> None:
+        """Remove all cached results and reset the statistics."""
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+            self.hits = self.misses = 0
+
+    @property
+    def nbytes(self) -> int:
+        """The number of bytes of captured output currently cached."""
+        return self._nbytes
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __repr__(self) -> str:
+        return (
+            f"<{type(self).__name__} {len(self)}/{self.maxsize} results"
+            f" {self._nbytes}/{self.max_bytes} bytes"
+            f" hits={self.hits} misses={self.misses}>"
+        )
+
+
+class DiskResultCache:
+    """A persistent cache of invocation results, stored as one pickled file
+    per invocation named after the digest of its key so any number of
+    processes can share it.
+
+    Callables are identified by the source of their module and of the
+    modules it imports instead of by their code object, so results are
+    reused across test sessions until that source changes.  Functions
+    defined inside other functions cannot be cached on disk.
+
+    Args:
+        directory: the directory the results are stored in, by default
+            ``results`` in the ``clirunner`` application directory.
+        max_bytes: the maximum size of all stored results.  When it is
+            exceeded, the least recently used results are removed.
+        include_files: if `True`, the key of an invocation inside
+            `CliRunner.isolated_filesystem` includes the names and contents
+            of the files in the isolated directory.
+    """
+
+    def __init__(
+        self,
+        directory: str | os.PathLike[str] | None = None,
+        max_bytes: int = 256 * 1024 * 1024,
+        include_files: bool = False,
+    ) -> None:
+        if directory is None:
+            directory = os.path.join(utils.get_app_dir("clirunner"), "results")
+        self.directory = os.fspath(directory)
+        self.max_bytes = max_bytes
+        self.include_files = include_files
+        #: The number of lookups which found a result.
+        self.hits = 0
+        #: The number of lookups which found no result.
+        self.misses = 0
+        # the size of the stored results, summed on the first `put` and kept
+        # up to date with the results stored by this process since
+        self._nbytes: int | None = None
+
+    def callable_key(self, cli: t.Callable[..., t.Any]) -> t.Hashable:
+        """Return the part of the cache key identifying `cli`.
+
+        Raises:
+            TypeError: if `cli` cannot be cached.
+        """
+        return source_key(cli)
+
+    def _path(self, key: t.Hashable) -> str:
+        identity = (__version__, sys.version_info[:2], key)
+        digest = hashlib.sha256(repr(identity).encode()).hexdigest()
+        return os.path.join(self.directory, digest[:2], f"{digest}.pickle")
+
+    def get(self, key: t.Hashable) -> t.Any | None:
+        """Return the result stored for `key` or `None`."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                result = pickle.load(f)
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception:
+            # written by an incompatible version, or truncated
+            with contextlib.suppress(OSError):
+                os.remove(path)
+            self.misses += 1
+            return None
+        self.hits += 1
+        return result
+
+    def put(self, key: t.Hashable, result: t.Any, size: int) -> None:
+        """Store `result` for `key`; results which cannot be pickled, such as
+        those holding an unpicklable exception, are not stored.
+        """
+        if size > self.max_bytes:
+            return
+        result = copy.copy(result)
+        result.runner = None
+        try:
+            data = pickle.dumps(result, pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            return
+        path = self._path(key)
+        try:
+            replaced = os.stat(path).st_size
+        except OSError:
+            replaced = 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(temp, path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(temp)
+            raise
+        if self._nbytes is None:
+            self._nbytes = sum(size for _, size, _ in self._entries())
+        else:
+            self._nbytes += len(data) - replaced
+        # other processes may have stored results too, so the directory is
+        # only walked again when this total exceeds the limit
+        if self._nbytes > self.max_bytes:
+            self._prune()
+
+    def _entries(self) -> list[tuple[int, int, str]]:
+        """Return the modification time, size and path of the stored
+        results.
+        """
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".pickle"):
+                    path = os.path.join(root, name)
+                    with contextlib.suppress(OSError):
+                        stat = os.stat(path)
+                        entries.append((stat.st_mtime_ns, stat.st_size, path))
+        return entries
+
+    def _prune(self) -> None:
+        """Remove the least recently used results until the stored results
+        fit in `max_bytes`.
+        """
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            with contextlib.suppress(OSError):
+                os.remove(path)
+            total -= size
+        self._nbytes = total
+
+    def clear(self) -> None:
+        """Remove all stored results and reset the statistics."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.hits = self.misses = 0
+        self._nbytes = None
+
+    def __repr__(self) -> str:
+        return (
+            f"<{type(self).__name__} {self.directory!r}"
+            f" hits={self.hits} misses={self.misses}>"
+        )
+
+
+#: The cache used by runners created with ``cache=True``.
+shared_cache = ResultCache()
@@ -0,0 +1,187 @@
+"""Context-local routing of the interpreter globals swapped by `CliRunner`.
+
+While at least one concurrent invocation is active, `sys.stdin`, `sys.stdout`,
+`sys.stderr`, `sys.argv` and `os.environ` are replaced by proxies which look
+up the streams, arguments and environment of the invocation running in the
+current `contextvars` context, and fall back to the original objects outside
+of any invocation.  Each thread and each asyncio task has its own context, so
+any number of invocations can run in parallel.
+"""
+
+from __future__ import annotations
+
+import collections.abc as cabc
+import contextlib
+import contextvars
+import os
+import sys
+import threading
+import typing as t
+
+
+class _Isolated:
+    """The globals of a single invocation."""
+
+    __slots__ = ("stdin", "stdout", "stderr", "argv", "environ")
+
+    def __init__(
+        self,
+        stdin: t.TextIO,
+        stdout: t.TextIO,
+        stderr: t.TextIO,
+        argv: list[str],
+        environ: dict[str, str],
+    ) -> None:
+        self.stdin = stdin
+        self.stdout = stdout
+        self.stderr = stderr
+        self.argv = argv
+        self.environ = environ
+
+
+_current: contextvars.ContextVar[_Isolated | None] = contextvars.ContextVar(
+    "clirunner_isolated", default=None
+)
+
+
+class _StreamProxy:
+    """Forwards to the stream of the current invocation."""
+
+    def __init__(self, name: str, fallback: t.TextIO) -> None:
+        self._name = name
+        self._fallback = fallback
+
+    def _target(self) -> t.TextIO:
+        state = _current.get()
+        if state is None:
+            return self._fallback
+        return t.cast(t.TextIO, getattr(state, self._name))
+
+    def __getattr__(self, name: str) -> t.Any:
+        return getattr(self._target(), name)
+
+    def __iter__(self) -> cabc.Iterator[str]:
+        return iter(self._target())
+
+    def __repr__(self) -> str:
+        return repr(self._target())
+
+
+class _ArgvProxy(cabc.MutableSequence):  # type: ignore[type-arg]
+    """Forwards to the `sys.argv` list of the current invocation."""
+
+    def __init__(self, fallback: list[str]) -> None:
+        self._fallback = fallback
+
+    def _target(self) -> list[str]:
+        state = _current.get()
+        return self._fallback if state is None else state.argv
+
+    def __getitem__(self, index: t.Any) -> t.Any:
+        return self._target()[index]
+
+    def __setitem__(self, index: t.Any, value: t.Any) -> None:
+        self._target()[index] = value
+
+    def __delitem__(self, index: t.Any) -> None:
+        del self._target()[index]
+
+    def __len__(self) -> int:
+        return len(self._target())
+
+    def insert(self, index: int, value: str) -> None:
+        self._target().insert(index, value)
+
+    def copy(self) -> list[str]:
+        return list(self._target())
+
+    def __add__(self, other: list[str]) -> list[str]:
+        return self._target() + list(other)
+
+    def __radd__(self, other: list[str]) -> list[str]:
+        return list(other) + self._target()
+
+    def __eq__(self, other: object) -> bool:
+        return self._target() == other
+
+    def __repr__(self) -> str:
+        return repr(self._target())
+
+
+class _EnvironProxy(cabc.MutableMapping):  # type: ignore[type-arg]
+    """Forwards to the `os.environ` mapping of the current invocation."""
+
+    def __init__(self, fallback: cabc.MutableMapping[str, str]) -> None:
+        self._fallback = fallback
+
+    def _target(self) -> cabc.MutableMapping[str, str]:
+        state = _current.get()
+        return self._fallback if state is None else state.environ
+
+    def __getitem__(self, key: str) -> str:
+        return self._target()[key]
+
+    def __setitem__(self, key: str, value: str) -> None:
+        self._target()[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        del self._target()[key]
+
+    def __iter__(self) -> cabc.Iterator[str]:
+        return iter(self._target())
+
+    def __len__(self) -> int:
+        return len(self._target())
+
+    def copy(self) -> dict[str, str]:
+        return dict(self._target())
+
+    def __repr__(self) -> str:
+        return repr(self._target())
+
+
+_lock = threading.Lock()
+_active = 0
+_saved: tuple[t.Any, ...] | None = None
+
+
+def _install() -> None:
+    global _active, _saved
+    with _lock:
+        if _active == 0:
+            _saved = (sys.stdin, sys.stdout, sys.stderr, sys.argv, os.environ)
+            sys.stdin = t.cast(t.TextIO, _StreamProxy("stdin", sys.stdin))
+            sys.stdout = t.cast(t.TextIO, _StreamProxy("stdout", sys.stdout))
+            sys.stderr = t.cast(t.TextIO, _StreamProxy("stderr", sys.stderr))
+            sys.argv = t.cast("list[str]", _ArgvProxy(sys.argv))
+            os.environ = _EnvironProxy(os.environ)  # type: ignore
+        _active += 1
+
+
+def _uninstall() -> None:
+    global _active, _saved
+    with _lock:
+        _active -= 1
+        if _active == 0 and _saved is not None:
+            sys.stdin, sys.stdout, sys.stderr, sys.argv, os.environ = _saved
+            _saved = None
+
+
+@contextlib.contextmanager
+def isolated(
+    stdin: t.TextIO,
+    stdout: t.TextIO,
+    stderr: t.TextIO,
+    argv: list[str],
+    environ: dict[str, str],
+) -> cabc.Iterator[None]:
+    """Route the interpreter globals to the given objects for the current
+    context until the block exits.
+    """
+    _install()
+    token = _current.set(_Isolated(stdin, stdout, stderr, argv, environ))
+    try:
+        yield
+    finally:
+        _current.reset(token)
+        _uninstall()
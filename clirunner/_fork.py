@@ -0,0 +1,229 @@
+"""Run functions in forked child processes for `CliRunner(fork=True)`.
+
+Functions that can be pickled by reference are run by a zygote: a process
+forked from the caller on first use which unpickles each request, importing
+the function's module once, and then forks a fresh child per call.  Other
+callables, such as closures defined inside a test, are run in a child forked
+directly from the calling process.  Either way the call sees a warm
+interpreter with all modules already imported, and nothing it does to
+`sys.modules`, module globals or `os.environ` leaks back into the caller.
+
+The zygote is forked once, so every request carries the caller's current
+working directory, `os.environ` and `sys.path`, which are applied in the
+child before the call.  Other changes the caller makes to module state after
+the zygote started, such as attributes patched with ``monkeypatch.setattr``,
+are not seen by functions run by the zygote.
+"""
+
+from __future__ import annotations
+
+import atexit
+import os
+import pickle
+import sys
+import threading
+import typing as t
+
+R = t.TypeVar("R")
+
+# the working directory, environment and module search path of the caller
+_State = t.Tuple[str, t.Dict[str, str], t.List[str]]
+
+
+class ChildCrashedError(ChildProcessError):
+    """Raised when a forked child exits without returning a result."""
+
+    def __init__(self, status: int) -> None:
+        self.exit_code = os.waitstatus_to_exitcode(status)
+        if self.exit_code < 0:
+            message = f"forked process was killed by signal {-self.exit_code}"
+        else:
+            message = f"forked process exited with status {self.exit_code}"
+        super().__init__(message)
+
+
+def _snapshot() -> _State:
+    return os.getcwd(), dict(os.environ), list(sys.path)
+
+
+def _restore(state: _State) -> None:
+    cwd, environ, path = state
+    os.chdir(cwd)
+    os.environ.clear()
+    os.environ.update(environ)
+    sys.path[:] = path
+
+
+def _run_child(
+    func: t.Callable[..., t.Any],
+    args: tuple[t.Any, ...],
+    fd: int,
+    state: _State | None = None,
+) -> t.NoReturn:
+    """Run `func` in the forked child and write the pickled outcome to `fd`."""
+    try:
+        try:
+            if state is not None:
+                _restore(state)
+            outcome: tuple[str, t.Any] = ("return", func(*args))
+        except BaseException as e:
+            outcome = ("raise", e)
+        try:
+            payload = pickle.dumps(outcome)
+        except Exception as e:
+            payload = pickle.dumps(("raise", RuntimeError(f"{outcome[1]!r}: {e}")))
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+    finally:
+        os._exit(0)
+
+
+def _fork_call(
+    func: t.Callable[..., t.Any],
+    args: tuple[t.Any, ...],
+    state: _State | None = None,
+    close_fds: tuple[int, ...] = (),
+) -> tuple[int, bytes]:
+    """Fork a child to run ``func(*args)``; return its wait status and output.
+
+    If `state` is given, it is applied in the child before the call.  The
+    descriptors `close_fds` are closed in the child.
+    """
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        for fd in close_fds:
+            os.close(fd)
+        _run_child(func, args, write_fd, state)
+    os.close(write_fd)
+    with os.fdopen(read_fd, "rb") as f:
+        payload = f.read()
+    _, status = os.waitpid(pid, 0)
+    return status, payload
+
+
+def _unpack(status: int, payload: bytes) -> t.Any:
+    if not payload:
+        raise ChildCrashedError(status)
+    kind, value = pickle.loads(payload)
+    if kind == "raise":
+        raise value
+    return value
+
+
+class _Zygote:
+    """A process forked once which forks a child for every request."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._pid: int | None = None
+        self._owner: int | None = None
+        self._requests: t.BinaryIO | None = None
+        self._responses: t.BinaryIO | None = None
+
+    def _start(self) -> None:
+        request_r, request_w = os.pipe()
+        response_r, response_w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(request_w)
+            os.close(response_r)
+            try:
+                self._serve(request_r, response_w)
+            finally:
+                os._exit(0)
+        os.close(request_r)
+        os.close(response_w)
+        self._pid = pid
+        self._owner = os.getpid()
+        self._requests = os.fdopen(request_w, "wb")
+        self._responses = os.fdopen(response_r, "rb")
+
+    @staticmethod
+    def _serve(request_fd: int, response_fd: int) -> None:
+        with os.fdopen(request_fd, "rb") as requests, os.fdopen(
+            response_fd, "wb"
+        ) as responses:
+            while True:
+                try:
+                    request = requests.read(int.from_bytes(requests.read(8), "big"))
+                    if not request:
+                        return
+                    func, args, state = pickle.loads(request)
+                    # the child must not keep the pipes of a zygote that dies
+                    status, payload = _fork_call(
+                        func, args, state, (request_fd, response_fd)
+                    )
+                except Exception as e:
+                    status, payload = 0, pickle.dumps(("raise", e))
+                pickle.dump((status, payload), responses)
+                responses.flush()
+
+    def call(self, request: bytes) -> tuple[int, bytes]:
+        """Send `request` to the zygote; return the wait status and output of
+        the child that ran it.
+
+        A zygote that died is replaced and sent the request again if it had
+        not received it yet.  If it dies while the request runs, the wait
+        status of the zygote is returned with no output.
+        """
+        with self._lock:
+            try:
+                self._send(request)
+            except BrokenPipeError:
+                # the zygote died since the previous call; start a new one
+                self._reap()
+                self._send(request)
+            assert self._responses is not None
+            try:
+                return t.cast("tuple[int, bytes]", pickle.load(self._responses))
+            except EOFError:
+                return self._reap(), b""
+
+    def _send(self, request: bytes) -> None:
+        if self._owner != os.getpid():
+            # first use, or we are a fork of the process owning the zygote
+            self._start()
+        assert self._requests is not None
+        self._requests.write(len(request).to_bytes(8, "big") + request)
+        self._requests.flush()
+
+    def _reap(self) -> int:
+        """Close the pipes to the zygote and wait for it to exit; return its
+        wait status.
+        """
+        assert self._requests is not None and self._responses is not None
+        for pipe in (self._requests, self._responses):
+            try:
+                pipe.close()
+            except OSError:
+                # unflushed data for a zygote that died
+                pass
+        assert self._pid is not None
+        _, status = os.waitpid(self._pid, 0)
+        self._pid = self._owner = None
+        return status
+
+    def stop(self) -> None:
+        with self._lock:
+            if self._owner != os.getpid() or self._pid is None:
+                return
+            self._reap()
+
+
+_zygote = _Zygote()
+atexit.register(_zygote.stop)
+
+
+def call(func: t.Callable[..., R], *args: t.Any) -> R:
+    """Call ``func(*args)`` in a forked child process and return its result.
+
+    Exceptions raised by `func` are re-raised in the caller.  If the child
+    exits before returning, `ChildCrashedError` is raised.
+    """
+    try:
+        request = pickle.dumps((func, args, _snapshot()))
+    except Exception:
+        return t.cast(R, _unpack(*_fork_call(func, args)))
+    return t.cast(R, _unpack(*_zygote.call(request)))
@@ -0,0 +1,234 @@
+"""Populating `CliRunner.isolated_filesystem` directories from templates.
+
+Files are cloned with copy-on-write reflinks where the file system supports
+them (Btrfs, XFS, bcachefs and others on Linux), so even large fixture trees
+are copied in constant time per file without duplicating their data.  Where
+reflinks are not supported, files are copied or, if requested, hard linked.
+
+Isolated directories can also be placed on a RAM-backed file system such as
+``/dev/shm`` to avoid disk I/O, when one with enough free space is available.
+
+Templates given as callables are "golden" directories: they are built once
+per process into a private temporary directory which is removed at exit, and
+cloned for every use.
+
+Isolated directories are discarded by renaming them into a trash directory
+next to them, which is instant, and deleted by a background thread.  All
+discarded directories are deleted before the interpreter exits.
+"""
+
+from __future__ import annotations
+
+import atexit
+import errno
+import os
+import queue
+import shutil
+import stat
+import tempfile
+import threading
+import typing as t
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None  # type: ignore
+
+# from linux/fs.h
+_FICLONE = 0x40049409
+
+# errors of FICLONE and link meaning the file system does not support them
+_UNSUPPORTED = {
+    errno.EBADF,
+    errno.EINVAL,
+    errno.ENOSYS,
+    errno.ENOTTY,
+    errno.EOPNOTSUPP,
+    errno.EPERM,
+    errno.EXDEV,
+    errno.EMLINK,
+}
+
+# RAM-backed directories tried when no directory is configured
+_MEMORY_DIRS = ("/dev/shm",)
+
+# devices of directories which do not support reflinks
+_no_reflink: set[int] = set()
+
+_lock = threading.Lock()
+_golden: dict[t.Callable[[str], t.Any], str] = {}
+_golden_root: str | None = None
+
+
+def _reflink(src: str, dst: str) -> bool:
+    """Clone `src` to `dst` with a reflink; return `False` if the file system
+    does not support it.
+    """
+    if fcntl is None:
+        return False
+    device = os.stat(os.path.dirname(dst) or ".").st_dev
+    if device in _no_reflink:
+        return False
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED:
+                raise
+            _no_reflink.add(device)
+            cloned = False
+        else:
+            cloned = True
+    if not cloned:
+        os.remove(dst)
+    return cloned
+
+
+def clone_file(src: str, dst: str) -> str:
+    """Copy a file with a reflink if possible, and with `shutil.copy2`
+    otherwise.
+    """
+    if _reflink(src, dst):
+        shutil.copystat(src, dst)
+        return dst
+    return t.cast(str, shutil.copy2(src, dst))
+
+
+def link_file(src: str, dst: str) -> str:
+    """Copy a file with a reflink if possible, and hard link it otherwise,
+    falling back to `shutil.copy2` where hard links are not supported either.
+    """
+    if _reflink(src, dst):
+        shutil.copystat(src, dst)
+        return dst
+    try:
+        os.link(src, dst)
+    except OSError as e:
+        if e.errno not in _UNSUPPORTED:
+            raise
+        return t.cast(str, shutil.copy2(src, dst))
+    return dst
+
+
+def copy_template(
+    template: str | os.PathLike[str], directory: str, hardlink: bool = False
+) -> None:
+    """Copy the contents of the `template` directory into `directory`."""
+    shutil.copytree(
+        template,
+        directory,
+        symlinks=True,
+        copy_function=link_file if hardlink else clone_file,
+        dirs_exist_ok=True,
+    )
+
+
+def golden(build: t.Callable[[str], t.Any]) -> str:
+    """Return the directory built by calling `build` with an empty directory
+    the first time it is requested in this process.
+    """
+    global _golden_root
+    with _lock:
+        directory = _golden.get(build)
+        if directory is not None:
+            return directory
+        if _golden_root is None:
+            _golden_root = tempfile.mkdtemp(prefix="clirunner-templates-")
+            atexit.register(shutil.rmtree, _golden_root, True)
+        directory = tempfile.mkdtemp(dir=_golden_root)
+        try:
+            build(directory)
+        except BaseException:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+        _golden[build] = directory
+        return directory
+
+
+def memory_dir(
+    directory: str | os.PathLike[str] | None, min_free: int
+) -> str | None:
+    """Return `directory`, or the first available default RAM-backed
+    directory, if it is a writable directory with at least `min_free` bytes
+    free, and `None` otherwise.
+    """
+    candidates = _MEMORY_DIRS if directory is None else (os.fspath(directory),)
+    for candidate in candidates:
+        try:
+            free = shutil.disk_usage(candidate).free
+        except OSError:
+            continue
+        if free >= min_free and os.access(candidate, os.W_OK | os.X_OK):
+            return candidate
+    return None
+
+
+class _Trash:
+    """Deletes discarded directories in a background thread."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._owner: int | None = None
+        self._queue: queue.Queue[str] = queue.Queue()
+        self._dirs: dict[str, str] = {}
+
+    def discard(self, directory: str) -> None:
+        """Move `directory` out of the way and delete it in the background."""
+        parent = os.path.dirname(directory)
+        with self._lock:
+            if self._owner != os.getpid():
+                # first use, or we are a fork of the process with the thread
+                self._owner = os.getpid()
+                self._queue = queue.Queue()
+                self._dirs = {}
+                threading.Thread(
+                    target=self._run,
+                    args=(self._queue,),
+                    name="clirunner-cleanup",
+                    daemon=True,
+                ).start()
+            try:
+                trash = self._dirs.get(parent) or self._make(parent)
+                target = os.path.join(trash, os.path.basename(directory))
+                os.rename(directory, target)
+            except OSError:
+                # for example files still open on Windows; delete it in place
+                target = directory
+            self._queue.put(target)
+
+    def _make(self, parent: str) -> str:
+        # a fresh private directory per process, never one another user could
+        # have created in a shared parent such as /tmp
+        trash = tempfile.mkdtemp(prefix=".clirunner-trash-", dir=parent)
+        st = os.lstat(trash)
+        if not stat.S_ISDIR(st.st_mode) or (
+            hasattr(os, "getuid")
+            and (st.st_uid != os.getuid() or stat.S_IMODE(st.st_mode) & 0o077)
+        ):
+            raise OSError(f"unsafe trash directory: {trash}")
+        self._dirs[parent] = trash
+        return trash
+
+    @staticmethod
+    def _run(pending: queue.Queue[str]) -> None:
+        while True:
+            directory = pending.get()
+            try:
+                shutil.rmtree(directory, ignore_errors=True)
+            finally:
+                pending.task_done()
+
+    def flush(self) -> None:
+        """Wait until all discarded directories are deleted."""
+        with self._lock:
+            if self._owner != os.getpid():
+                return
+            pending, dirs = self._queue, self._dirs
+            self._dirs = {}
+        pending.join()
+        for trash in dirs.values():
+            shutil.rmtree(trash, ignore_errors=True)
+
+
+trash = _Trash()
+atexit.register(trash.flush)
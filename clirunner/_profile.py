@@ -0,0 +1,169 @@
+"""Profiling of the command call for `CliRunner.invoke(profile=...)`."""
+
+from __future__ import annotations
+
+import collections
+import cProfile
+import io
+import os
+import pstats
+import typing as t
+
+R = t.TypeVar("R")
+
+# a function in cProfile statistics: (file name, line number, function name)
+_Func = t.Tuple[str, int, str]
+
+_DISABLE = "<method 'disable' of '_lsprof.Profiler' objects>"
+
+# collapsed stack paths with less time than this are left out, in seconds
+_MIN_PATH_TIME = 1e-6
+
+
+class _StatsSource:
+    """Provides raw cProfile statistics to `pstats.Stats`."""
+
+    def __init__(self, stats: dict[_Func, t.Any]) -> None:
+        self.stats = stats
+
+    def create_stats(self) -> None:
+        pass
+
+
+def _label(func: _Func) -> str:
+    filename, line, name = func
+    if filename == "~":
+        # built-in functions
+        return name
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+
+class ProfileStats:
+    """cProfile statistics of the call of a command, available as
+    `Result.profile` for invocations with ``profile=True``.
+
+    Args:
+        stats: the statistics collected by `cProfile.Profile`.
+    """
+
+    def __init__(self, stats: dict[_Func, t.Any]) -> None:
+        self._stats = stats
+
+    @property
+    def stats(self) -> pstats.Stats:
+        """The statistics as a new `pstats.Stats` object."""
+        return pstats.Stats(_StatsSource(dict(self._stats)))  # type: ignore
+
+    @property
+    def total_time(self) -> float:
+        """The total time spent in profiled functions in seconds."""
+        return float(sum(entry[2] for entry in self._stats.values()))
+
+    def text(self, sort: str = "cumulative", limit: int | None = 30) -> str:
+        """Returns a report of the `limit` most expensive functions by `sort`,
+        as printed by `pstats.Stats.print_stats`.
+        """
+        stream = io.StringIO()
+        stats = self.stats
+        stats.stream = stream  # type: ignore
+        stats.sort_stats(sort).print_stats(*([] if limit is None else [limit]))
+        return stream.getvalue()
+
+    def dump(self, path: str | os.PathLike[str]) -> None:
+        """Writes the statistics to `path` in the `pstats` format, for tools
+        such as ``snakeviz`` or ``python -m pstats``.
+        """
+        self.stats.dump_stats(path)
+
+    def collapsed(self) -> str:
+        """Returns the statistics as collapsed stacks, one
+        ``caller;callee;... microseconds`` line per call path, for
+        ``flamegraph.pl``, speedscope and similar tools.
+
+        cProfile only records pairs of callers and callees, so the time of a
+        function called from several places is split between its call paths
+        in proportion to the time of the calls from each caller.
+        """
+        stats = self._stats
+        children: dict[_Func, list[tuple[_Func, float]]]
+        children = collections.defaultdict(list)
+        for callee, (_, _, _, _, callers) in stats.items():
+            for caller, edge in callers.items():
+                if caller in stats:
+                    children[caller].append((callee, edge[3]))
+        paths: collections.Counter[str] = collections.Counter()
+
+        def walk(func: _Func, path: tuple[_Func, ...], scale: float) -> None:
+            inline_time = stats[func][2]
+            path += (func,)
+            paths[";".join(map(_label, path))] += inline_time * scale
+            for callee, edge_time in children.get(func, ()):
+                time = edge_time * scale
+                if callee in path or time < _MIN_PATH_TIME:
+                    continue
+                walk(callee, path, time / stats[callee][3])
+
+        for func, (_, _, _, _, callers) in stats.items():
+            if not any(caller in stats for caller in callers):
+                walk(func, (), 1.0)
+        return "".join(
+            f"{path} {round(time * 1e6)}\n"
+            for path, time in sorted(paths.items())
+            if round(time * 1e6) > 0
+        )
+
+    def dump_collapsed(self, path: str | os.PathLike[str]) -> None:
+        """Writes `collapsed` stacks to `path`."""
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.collapsed())
+
+    def __repr__(self) -> str:
+        return (
+            f"<{type(self).__name__} {len(self._stats)} functions"
+            f" {self.total_time:.6f}s>"
+        )
+
+
+class Profiling:
+    """Profiles calls made with `call`.
+
+    Args:
+        profile: `True` or ``"cprofile"`` to use `cProfile`, or a callable
+            returning a context manager, such as ``pyinstrument.Profiler``.
+
+    Raises:
+        ValueError: if `profile` is not one of these.
+    """
+
+    def __init__(self, profile: t.Any) -> None:
+        self._cprofile = profile is True or profile == "cprofile"
+        if self._cprofile:
+            self._profiler: t.Any = cProfile.Profile()
+        elif callable(profile):
+            self._profiler = profile()
+        else:
+            raise ValueError(f"Unknown profiler {profile!r}")
+        self._entered: t.Any = None
+
+    def call(self, func: t.Callable[[], R]) -> R:
+        """Call `func` with profiling enabled and return its result."""
+        if self._cprofile:
+            return t.cast(R, self._profiler.runcall(func))
+        with self._profiler as entered:
+            self._entered = entered
+            return func()
+
+    def result(self) -> t.Any:
+        """Returns `ProfileStats` for `cProfile`, and the value the context
+        manager of other profilers returned when entered.
+        """
+        if self._cprofile:
+            self._profiler.create_stats()
+            stats = self._profiler.stats
+            # recorded as the profiler is disabled
+            for func in [func for func in stats if func[2] == _DISABLE]:
+                del stats[func]
+                for entry in stats.values():
+                    entry[4].pop(func, None)
+            return ProfileStats(stats)
+        return self._entered
@@ -49,3 +49,37 @@ class FileError(ClickException):
         return _("Could not open file {filename!r}: {message}").format(
             filename=self.ui_filename, message=self.message
         )
+
+
+class InvocationTimeout(TimeoutError):
+    """Raised if an invoked CLI does not finish within its timeout."""
+
+    def __init__(self, timeout: float, stack: str) -> None:
+        super().__init__(timeout, stack)
+        self.timeout = timeout
+        #: The stack of the CLI at the moment it was interrupted.
+        self.stack = stack
+
+    def __str__(self) -> str:
+        message = _("CLI did not finish within {timeout} seconds").format(
+            timeout=self.timeout
+        )
+        if not self.stack:
+            return message
+        return f"{message}; it was interrupted at:\n{self.stack}"
+
+
+class InvocationAborted(Exception):
+    """Recorded when an ``on_output`` callback stops an invoked CLI."""
+
+    def __init__(self, stream: str, chunk: bytes) -> None:
+        super().__init__(stream, chunk)
+        #: The stream the output that stopped the CLI was written to.
+        self.stream = stream
+        #: The output that stopped the CLI.
+        self.chunk = chunk
+
+    def __str__(self) -> str:
+        return _("CLI was stopped after writing {chunk!r} to {stream}").format(
+            chunk=self.chunk, stream=self.stream
+        )
@@ -6,23 +6,52 @@ Original source code: https://github.com/pallets/click/blob/main/src/click/testi
 
 from __future__ import annotations
 
+import builtins
+import codecs
 import collections.abc as cabc
 import contextlib
 import io
+import itertools
+import math
 import os
-import shlex
-import shutil
+import re
 import sys
-import tempfile
+import time
 import typing as t
-from types import TracebackType
+from types import FrameType, TracebackType
 
-from . import utils
-from ._compat import _find_binary_reader
+# Modules only needed by some features, such as the caches, profiling,
+# timeouts, threads, `fork` or `isolated_filesystem`, are imported where they are used so that
+# importing this module stays fast.
 
 if t.TYPE_CHECKING:
+    import mmap
+    import threading
+    import tracemalloc
+
     from _typeshed import ReadableBuffer
 
+    from . import _profile
+    from ._cache import DiskResultCache, ResultCache
+    from ._profile import ProfileStats  # noqa: F401
+
+_Storage = t.Union[bytes, bytearray, "mmap.mmap"]
+_StreamName = t.Literal["output", "stdout", "stderr"]
+_InputSource = t.Union[
+    str,
+    bytes,
+    t.IO[t.Any],
+    "os.PathLike[str]",
+    cabc.Iterable[t.Union[str, bytes]],
+    cabc.AsyncIterable[t.Union[str, bytes]],
+]
+
+# number of chunks an async iterable input is read ahead of the CLI
+_ASYNC_INPUT_QUEUE_SIZE = 16
+
+# number of bytes decoded at a time by `Result.iter_lines`
+_LINE_CHUNK_SIZE = 64 * 1024
+
 
 class EchoingStdin:
     def __init__(self, input: t.BinaryIO, output: t.BinaryIO) -> None:
@@ -58,32 +87,323 @@ class EchoingStdin:
         return repr(self._input)
 
 
-class BytesIOCopy(io.BytesIO):
-    """Patch ``io.BytesIO`` to let the written stream be copied to another."""
+class CapturedBytes:
+    """A read-only, bytes-like view of captured output.
+
+    The common read-only `bytes` operations (comparison, ``in``, `find`,
+    `decode`, slicing and `len`) run directly against the capture storage
+    without copying it.  Any other `bytes` attribute is looked up on a
+    materialized copy, so a `CapturedBytes` can be used wherever the
+    captured `bytes` were used before.
+
+    Args:
+        data: the object holding the captured data, or a callable returning
+            it which is called the first time the data is needed.
+        start: offset of the first byte of the view in `data`.
+        end: offset one past the last byte of the view in `data`; defaults
+            to the length of `data`.
+    """
+
+    def __init__(
+        self,
+        data: _Storage | t.Callable[[], _Storage],
+        start: int = 0,
+        end: int | None = None,
+    ) -> None:
+        self._data = data
+        self._start = start
+        self._end = end
+
+    def _resolve(self) -> tuple[_Storage, int, int]:
+        if callable(self._data):
+            self._data = self._data()
+        if self._end is None:
+            self._end = len(self._data)
+        return self._data, self._start, self._end
+
+    def memoryview(self) -> memoryview:
+        """Return a `memoryview` of the captured bytes without copying them."""
+        data, start, end = self._resolve()
+        return memoryview(data)[start:end]
+
+    def tobytes(self) -> bytes:
+        """Return a copy of the captured bytes as `bytes`."""
+        data, start, end = self._resolve()
+        if isinstance(data, bytes) and start == 0 and end == len(data):
+            return data
+        with memoryview(data) as view, view[start:end] as part:
+            return part.tobytes()
+
+    def decode(self, encoding: str = "utf-8", errors: str = "strict") -> str:
+        data, start, end = self._resolve()
+        with memoryview(data) as view, view[start:end] as part:
+            return str(part, encoding, errors)
+
+    def find(
+        self, sub: bytes | int, start: int | None = None, end: int | None = None
+    ) -> int:
+        if isinstance(sub, int):
+            sub = bytes((sub,))
+        data, offset, stop = self._resolve()
+        first, last, _ = slice(start, end).indices(stop - offset)
+        pos = data.find(sub, offset + first, offset + last)
+        return pos if pos == -1 else pos - offset
+
+    def __contains__(self, sub: bytes | int) -> bool:
+        return self.find(sub) != -1
+
+    def search(
+        self, pattern: bytes | re.Pattern[bytes], flags: int = 0
+    ) -> re.Match[bytes] | None:
+        """Scan the captured bytes for the first match of the regular
+        expression `pattern` without copying them.  Offsets in the returned
+        match are relative to the start of this view.
+        """
+        return re.compile(pattern, flags).search(self.memoryview())
+
+    def finditer(
+        self, pattern: bytes | re.Pattern[bytes], flags: int = 0
+    ) -> cabc.Iterator[re.Match[bytes]]:
+        """Iterate over all non-overlapping matches of the regular expression
+        `pattern` in the captured bytes without copying them.
+        """
+        return re.compile(pattern, flags).finditer(self.memoryview())
+
+    def __len__(self) -> int:
+        _, start, end = self._resolve()
+        return end - start
+
+    def __bytes__(self) -> bytes:
+        return self.tobytes()
+
+    def __buffer__(self, flags: int) -> builtins.memoryview:
+        # PEP 688: on Python 3.12+ a view can be passed directly to anything
+        # accepting a bytes-like object, e.g. ``re.search`` or ``memoryview``.
+        return self.memoryview()
+
+    def __iter__(self) -> cabc.Iterator[int]:
+        return iter(self.tobytes())
+
+    @t.overload
+    def __getitem__(self, key: t.SupportsIndex) -> int: ...
+
+    @t.overload
+    def __getitem__(self, key: slice) -> bytes: ...
+
+    def __getitem__(self, key: t.SupportsIndex | slice) -> int | bytes:
+        with self.memoryview() as view:
+            if isinstance(key, slice):
+                with view[key] as part:
+                    return part.tobytes()
+            return view[key]
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, CapturedBytes):
+            other = other.memoryview()
+        elif not isinstance(other, (bytes, bytearray, memoryview)):
+            return NotImplemented
+        with self.memoryview() as view:
+            return view == other
 
-    def __init__(self, copy_to: io.BytesIO) -> None:
+    def __hash__(self) -> int:
+        return hash(self.tobytes())
+
+    def __getattr__(self, name: str) -> t.Any:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.tobytes(), name)
+
+    def __reduce__(self) -> tuple[type[bytes], tuple[bytes]]:
+        # the storage may be an mmap, so views are pickled as plain bytes
+        return bytes, (self.tobytes(),)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self[:80]!r}, len={len(self)})"
+
+
+class _CaptureStream(io.BufferedIOBase):
+    """A write-only binary stream that records into a `StreamMixer` chunk log."""
+
+    def __init__(self, mixer: StreamMixer, name: str | None) -> None:
         super().__init__()
-        self.copy_to = copy_to
+        self._mixer = mixer
+        self._name = name
 
-    def flush(self) -> None:
-        super().flush()
-        self.copy_to.flush()
+    def writable(self) -> bool:
+        return self._name is not None
 
     def write(self, b: ReadableBuffer) -> int:
-        self.copy_to.write(b)
-        return super().write(b)
+        if self._name is None:
+            raise io.UnsupportedOperation("write")
+        return self._mixer._write(self._name, b)
+
+    def getvalue(self) -> bytes:
+        return self._mixer.getvalue(self._name)
+
+    def getbuffer(self) -> CapturedBytes:
+        return self._mixer.getbuffer(self._name)
 
 
 class StreamMixer:
     """Mixes `<stdout>` and `<stderr>` streams.
 
+    Writes to either stream are appended once to a shared buffer and recorded
+    in an interleaved chunk log of ``(stream name, start, end)`` entries.  The
+    per-stream and combined values are derived from the log on demand, so
+    every captured byte is only stored a single time while the CLI runs.
+
     The result is available in the ``output`` attribute.
+
+    Args:
+        spool_threshold: if set, the shared buffer is moved to a temporary
+            file once it grows beyond this many bytes.
+    """
+
+    def __init__(self, spool_threshold: int | None = None) -> None:
+        self._buffer = io.BytesIO()
+        self._size = 0
+        self._chunks: list[tuple[str, int, int]] = []
+        self._spool_threshold = spool_threshold
+        self._spool: t.BinaryIO | None = None
+        self._mmap: mmap.mmap | None = None
+        #: The number of ``write`` calls and bytes written per stream.
+        self.write_calls = {"stdout": 0, "stderr": 0}
+        self.bytes_written = {"stdout": 0, "stderr": 0}
+        #: Called with the stream name and bytes of every non-empty write
+        #: after it was recorded.
+        self.on_write: t.Callable[[str, bytes], t.Any] | None = None
+        self.stdout = _CaptureStream(self, "stdout")
+        self.stderr = _CaptureStream(self, "stderr")
+        self.output = _CaptureStream(self, None)
+
+    def _write(self, name: str, b: ReadableBuffer) -> int:
+        start = self._size
+        if self._spool is not None:
+            self._mmap = None
+            self._size += self._spool.write(b)
+        else:
+            self._size += self._buffer.write(b)
+            if (
+                self._spool_threshold is not None
+                and self._size > self._spool_threshold
+            ):
+                import tempfile
+
+                self._spool = t.cast(t.BinaryIO, tempfile.TemporaryFile())
+                self._spool.write(self._buffer.getbuffer())
+                self._buffer = io.BytesIO()
+        end = self._size
+        self.write_calls[name] += 1
+        if end == start:
+            return 0
+        self.bytes_written[name] += end - start
+        if self._chunks and self._chunks[-1][0] == name:
+            # consecutive writes to the same stream extend the last chunk
+            self._chunks[-1] = (name, self._chunks[-1][1], end)
+        else:
+            self._chunks.append((name, start, end))
+        if self.on_write is not None:
+            self.on_write(name, b if isinstance(b, bytes) else bytes(b))
+        return end - start
+
+    @property
+    def spooled(self) -> bool:
+        """True if the captured output was moved to a temporary file."""
+        return self._spool is not None
+
+    def _storage(self) -> _Storage:
+        if self._spool is None:
+            # shares the buffer of the BytesIO instead of copying it
+            return self._buffer.getvalue()
+        if self._mmap is None:
+            import mmap
+
+            self._spool.flush()
+            self._mmap = mmap.mmap(self._spool.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap
+
+    def _spans(self, name: str) -> list[tuple[int, int]]:
+        return [(start, end) for chunk, start, end in self._chunks if chunk == name]
+
+    def getbuffer(self, name: str | None = None) -> CapturedBytes:
+        """Return a `CapturedBytes` view of the bytes written to stream `name`,
+        or of the combined output of all streams if `name` is None.
+
+        The view references the capture storage directly unless `name` was
+        interleaved with the other stream, in which case its bytes are joined
+        the first time they are accessed.
+        """
+        data = self._storage()
+        if name is None:
+            return CapturedBytes(data, 0, self._size)
+        spans = self._spans(name)
+        if not spans:
+            return CapturedBytes(b"")
+        if len(spans) == 1:
+            return CapturedBytes(data, *spans[0])
+        return CapturedBytes(lambda: self._join(data, spans))
+
+    def getvalue(self, name: str | None = None) -> bytes:
+        """Return the bytes written to stream `name`, or the combined output
+        of all streams if `name` is None.
+        """
+        data = self._storage()
+        if name is None:
+            if isinstance(data, bytes):
+                return data
+            return self._join(data, [(0, self._size)])
+        return self._join(data, self._spans(name))
+
+    def detach(self) -> tuple[_Spans, _Spans, bytes]:
+        """Return the combined output as `bytes` with the `<stdout>` and
+        `<stderr>` bytes as `_Spans` of it, and `release` the capture.
+
+        The combined output shares the memory of the buffer, which is dropped
+        before anything else is built, so the captured bytes are held once.
+        """
+        output = self.getvalue()
+        stdout, stderr = self._spans("stdout"), self._spans("stderr")
+        self.release()
+        return _Spans(output, stdout), _Spans(output, stderr), output
+
+    def release(self) -> None:
+        """Drop the captured data and the references to the capture streams.
+
+        The streams reference the mixer, so this also breaks the reference
+        cycle which would otherwise keep the buffer alive until the next
+        collection of the cyclic garbage collector.  Values returned by
+        `getvalue` and `getbuffer` before stay valid.
+        """
+        self._buffer = io.BytesIO()
+        self._size = 0
+        self._chunks = []
+        self._spool = None
+        self._mmap = None
+        self.on_write = None
+        del self.stdout, self.stderr, self.output
+
+    @staticmethod
+    def _join(data: _Storage, spans: list[tuple[int, int]]) -> bytes:
+        with memoryview(data) as view:
+            return b"".join(view[start:end] for start, end in spans)
+
+
+class _Spans:
+    """The bytes of `spans` of `data`, joined the first time they are needed.
+
+    A single span covering all of `data` is `data` itself.
     """
 
-    def __init__(self) -> None:
-        self.output: io.BytesIO = io.BytesIO()
-        self.stdout: io.BytesIO = BytesIOCopy(copy_to=self.output)
-        self.stderr: io.BytesIO = BytesIOCopy(copy_to=self.output)
+    __slots__ = ("data", "spans")
+
+    def __init__(self, data: bytes, spans: list[tuple[int, int]]) -> None:
+        self.data = data
+        self.spans = spans
+
+    def join(self) -> bytes:
+        if self.spans == [(0, len(self.data))]:
+            return self.data
+        return StreamMixer._join(self.data, self.spans)
 
 
 class _NamedTextIOWrapper(io.TextIOWrapper):
@@ -103,11 +423,202 @@ class _NamedTextIOWrapper(io.TextIOWrapper):
         return self._mode
 
 
-def make_input_stream(
-    input: str | bytes | t.IO[t.Any] | None, charset: str
-) -> t.BinaryIO:
+class _IterableInput(io.RawIOBase):
+    """A readable raw stream which pulls its data from an iterator of chunks
+    only when it is read.
+    """
+
+    def __init__(
+        self,
+        chunks: cabc.Iterator[str | bytes],
+        charset: str,
+        stop: threading.Event | None = None,
+    ) -> None:
+        super().__init__()
+        self._chunks = chunks
+        self._charset = charset
+        self._stop = stop
+        self._pending = memoryview(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: t.Any) -> int:
+        while not self._pending:
+            try:
+                chunk = next(self._chunks)
+            except StopIteration:
+                return 0
+            if isinstance(chunk, str):
+                chunk = chunk.encode(self._charset)
+            self._pending = memoryview(chunk)
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+    def close(self) -> None:
+        if self._stop is not None:
+            self._stop.set()
+        super().close()
+
+
+class FileInput:
+    """Input for `CliRunner.invoke` which is read from a file.
+
+    The file is memory-mapped and `sys.stdin` reads straight from the
+    mapping, so large files are neither loaded up front nor copied through
+    an intermediate buffer.  Passing a `pathlib.Path` as input does the same.
+
+    Args:
+        path: the path of the file to read.
+    """
+
+    def __init__(self, path: str | os.PathLike[str]) -> None:
+        self.path = os.fspath(path)
+
+    def __fspath__(self) -> str:
+        return self.path
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.path!r})"
+
+
+class _MappedFileInput(io.BufferedIOBase):
+    """A readable binary stream over a memory-mapped file."""
+
+    def __init__(self, path: str | os.PathLike[str]) -> None:
+        super().__init__()
+        import mmap
+
+        self.name = os.fspath(path)
+        with open(path, "rb") as f:
+            self._size = os.fstat(f.fileno()).st_size
+            # empty files cannot be mapped
+            self._map = (
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                if self._size
+                else None
+            )
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def _end(self, size: int | None) -> int:
+        if size is None or size < 0:
+            return self._size
+        return min(self._pos + size, self._size)
+
+    def read(self, size: int | None = -1) -> bytes:
+        self._checkClosed()
+        end = self._end(size)
+        data = self._map[self._pos : end] if self._map is not None else b""
+        self._pos = max(self._pos, end)
+        return data
+
+    read1 = read
+
+    def readinto(self, buffer: t.Any) -> int:
+        self._checkClosed()
+        if self._map is None:
+            return 0
+        with memoryview(buffer) as target, memoryview(self._map) as source:
+            end = self._end(target.nbytes)
+            size = max(end - self._pos, 0)
+            target.cast("B")[:size] = source[self._pos : end]
+        self._pos += size
+        return size
+
+    readinto1 = readinto
+
+    def readline(self, size: int | None = -1) -> bytes:
+        self._checkClosed()
+        if self._map is None:
+            return b""
+        limit = self._end(size)
+        newline = self._map.find(b"\n", self._pos, limit)
+        return self.read((newline + 1 if newline != -1 else limit) - self._pos)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        self._checkClosed()
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self._size
+        if offset < 0:
+            raise ValueError(f"negative seek position {offset}")
+        self._pos = offset
+        return offset
+
+    def tell(self) -> int:
+        self._checkClosed()
+        return self._pos
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+        super().close()
+
+
+def _iterate_async(
+    chunks: cabc.AsyncIterable[str | bytes], stop: threading.Event
+) -> cabc.Iterator[str | bytes]:
+    """Iterate over an async iterable from synchronous code.
+
+    The async iterable is consumed by an event loop in a background thread
+    which is started on first use and stays at most a few chunks ahead of the
+    reader.  It stops early once `stop` is set.
+    """
+    import asyncio
+    import queue
+    import threading
+
+    chunk_queue: queue.Queue[tuple[str, t.Any]] = queue.Queue(_ASYNC_INPUT_QUEUE_SIZE)
+
+    def put(item: tuple[str, t.Any]) -> bool:
+        while not stop.is_set():
+            try:
+                chunk_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    async def pump() -> None:
+        try:
+            async for chunk in chunks:
+                if not put(("chunk", chunk)):
+                    return
+        except BaseException as e:
+            put(("error", e))
+        else:
+            put(("end", None))
+
+    threading.Thread(
+        target=asyncio.run, args=(pump(),), name="clirunner-input", daemon=True
+    ).start()
+    while True:
+        kind, value = chunk_queue.get()
+        if kind == "end":
+            return
+        if kind == "error":
+            raise value
+        yield value
+
+
+def make_input_stream(input: _InputSource | None, charset: str) -> t.BinaryIO:
+    # A file to memory-map.
+    if isinstance(input, os.PathLike):
+        return t.cast(t.BinaryIO, _MappedFileInput(input))
+
     # Is already an input stream.
     if hasattr(input, "read"):
+        from ._compat import _find_binary_reader
+
         rv = _find_binary_reader(t.cast("t.IO[t.Any]", input))
 
         if rv is not None:
@@ -119,35 +630,79 @@ def make_input_stream(
         input = b""
     elif isinstance(input, str):
         input = input.encode(charset)
+    elif isinstance(input, cabc.AsyncIterable):
+        import threading
+
+        stop = threading.Event()
+        raw = _IterableInput(_iterate_async(input, stop), charset, stop)
+        return t.cast(t.BinaryIO, io.BufferedReader(raw))
+    elif not isinstance(input, (bytes, bytearray, memoryview)):
+        raw = _IterableInput(iter(input), charset)
+        return t.cast(t.BinaryIO, io.BufferedReader(raw))
 
     return io.BytesIO(input)
 
 
+class _EchoingTextIOWrapper(_NamedTextIOWrapper):
+    """A text `<stdin>` which writes all text it returns to `output`.
+
+    The text is read in the usual large chunks and only echoed once it is
+    handed to the caller, so the echo matches exactly what was consumed
+    without decoding one byte at a time.  Binary reads through `buffer`
+    are echoed to the binary buffer of `output` by an `EchoingStdin`.
+    """
+
+    def __init__(
+        self,
+        buffer: t.BinaryIO,
+        output: t.TextIO,
+        name: str,
+        mode: str,
+        **kwargs: t.Any,
+    ) -> None:
+        super().__init__(buffer, name, mode, **kwargs)
+        self._echo_output = output
+        self._echo_buffer = EchoingStdin(buffer, output.buffer)
+
+    @property
+    def buffer(self) -> t.BinaryIO:
+        return t.cast(t.BinaryIO, self._echo_buffer)
+
+    def _echo(self, rv: str) -> str:
+        if rv and not self._echo_buffer._paused:
+            self._echo_output.write(rv)
+        return rv
+
+    def read(self, size: int | None = -1) -> str:
+        return self._echo(super().read(size))
+
+    def readline(self, size: int = -1) -> str:  # type: ignore[override]
+        # iterating over a TextIOWrapper subclass also calls readline
+        return self._echo(super().readline(size))
+
+
 class Result:
     """Holds the captured result of an invoked CLI script."""
 
     def __init__(
         self,
         runner: CliRunner,
-        stdout_bytes: bytes,
-        stderr_bytes: bytes,
-        output_bytes: bytes,
+        stdout_bytes: bytes | CapturedBytes | _Spans,
+        stderr_bytes: bytes | CapturedBytes | _Spans,
+        output_bytes: bytes | CapturedBytes,
         return_value: t.Any,
         exit_code: int,
         exception: BaseException | None,
         exc_info: (
             tuple[type[BaseException], BaseException, TracebackType] | None
         ) = None,
+        metrics: InvocationMetrics | None = None,
+        profile: t.Any = None,
     ):
         #: The runner that created the result
         self.runner = runner
-        #: The standard output as bytes.
-        self.stdout_bytes = stdout_bytes
-        #: The standard error as bytes.
-        #:
-        #: .. versionchanged:: 8.2
-        #:     No longer optional.
-        self.stderr_bytes = stderr_bytes
+        self._stdout_bytes = stdout_bytes
+        self._stderr_bytes = stderr_bytes
         #: A mix of `stdout_bytes` and `stderr_bytes``, as the user would see
         # it in its terminal.
         #:
@@ -163,38 +718,829 @@ class Result:
         self.exception = exception
         #: The traceback
         self.exc_info = exc_info
+        #: Performance measurements of the invocation.
+        self.metrics = metrics
+        #: The profile of the call of the command, if it was invoked with
+        #: ``profile``: `ProfileStats` for `cProfile`, and the profiler for
+        #: other profilers.
+        self.profile = profile
+        # decoded text by stream name, with the charset and bytes it came from
+        self._text_cache: dict[str, tuple[str, bytes | CapturedBytes, str]] = {}
+
+    @property
+    def stdout_bytes(self) -> bytes | CapturedBytes:
+        """The standard output as bytes, or as a `CapturedBytes` view when the
+        runner uses `zero_copy` or spools output to disk.
+        """
+        if isinstance(self._stdout_bytes, _Spans):
+            self._stdout_bytes = self._stdout_bytes.join()
+        return self._stdout_bytes
+
+    @stdout_bytes.setter
+    def stdout_bytes(self, value: bytes | CapturedBytes) -> None:
+        self._stdout_bytes = value
+
+    @property
+    def stderr_bytes(self) -> bytes | CapturedBytes:
+        """The standard error as bytes.
+
+        .. versionchanged:: 8.2
+            No longer optional.
+        """
+        if isinstance(self._stderr_bytes, _Spans):
+            self._stderr_bytes = self._stderr_bytes.join()
+        return self._stderr_bytes
+
+    @stderr_bytes.setter
+    def stderr_bytes(self, value: bytes | CapturedBytes) -> None:
+        self._stderr_bytes = value
+
+    def _text(self, stream: _StreamName) -> str:
+        charset = self.runner.charset
+        data = self._bytes(stream)
+        cached = self._text_cache.get(stream)
+        if cached is not None and cached[0] == charset and cached[1] is data:
+            return cached[2]
+        text = data.decode(charset, "replace").replace("\r\n", "\n")
+        self._text_cache[stream] = (charset, data, text)
+        return text
+
+    @property
+    def allocations(self) -> AllocationDiff | None:
+        """The memory allocated by the command and not freed when it
+        returned, if the runner was created with ``trace_allocations=True``.
+        """
+        return self.metrics.allocations if self.metrics is not None else None
+
+    def _bytes(self, stream: _StreamName) -> bytes | CapturedBytes:
+        if stream not in ("output", "stdout", "stderr"):
+            raise ValueError(f"Unknown stream {stream!r}")
+        return t.cast("bytes | CapturedBytes", getattr(self, f"{stream}_bytes"))
 
     @property
     def output(self) -> str:
         """The terminal output as unicode string, as the user would see it."""
-        return self.output_bytes.decode(self.runner.charset, "replace").replace(
-            "\r\n", "\n"
-        )
+        return self._text("output")
 
     @property
     def stdout(self) -> str:
         """The standard output as unicode string."""
-        return self.stdout_bytes.decode(self.runner.charset, "replace").replace(
-            "\r\n", "\n"
-        )
+        return self._text("stdout")
 
     @property
     def stderr(self) -> str:
         """The standard error as unicode string."""
-        return self.stderr_bytes.decode(self.runner.charset, "replace").replace(
-            "\r\n", "\n"
-        )
+        return self._text("stderr")
+
+    def iter_lines(
+        self, stream: _StreamName = "output", keepends: bool = False
+    ) -> cabc.Iterator[str]:
+        """Iterate over the lines of a captured stream as unicode strings.
+
+        The bytes are decoded incrementally, so the whole stream is never
+        materialized as a single string.  Lines are split on ``"\\n"`` after
+        ``"\\r\\n"`` is normalized as for `output`.
+
+        Args:
+            stream: one of ``"output"``, ``"stdout"``, or ``"stderr"``.
+            keepends: if `True`, the line endings are kept.
+        """
+        data = self._bytes(stream)
+        if isinstance(data, CapturedBytes):
+            view = data.memoryview()
+        else:
+            view = memoryview(data)
+        decoder = codecs.getincrementaldecoder(self.runner.charset)("replace")
+        # the parts of the current line, joined once its end is found, and a
+        # trailing "\r" held back in case the "\n" is in the next chunk
+        parts: list[str] = []
+        carry = ""
+        with view:
+            for offset in range(0, len(view) + 1, _LINE_CHUNK_SIZE):
+                with view[offset : offset + _LINE_CHUNK_SIZE] as chunk:
+                    final = offset + _LINE_CHUNK_SIZE > len(view)
+                    text = carry + decoder.decode(chunk, final)
+                if text.endswith("\r") and not final:
+                    text, carry = text[:-1], "\r"
+                else:
+                    carry = ""
+                lines = text.replace("\r\n", "\n").split("\n")
+                if len(lines) > 1:
+                    parts.append(lines[0])
+                    lines[0] = "".join(parts)
+                    for line in lines[:-1]:
+                        yield line + "\n" if keepends else line
+                    parts = []
+                if lines[-1]:
+                    parts.append(lines[-1])
+        if parts:
+            yield "".join(parts)
+
+    def lines(
+        self, stream: _StreamName = "output", keepends: bool = False
+    ) -> list[str]:
+        """Return the lines of a captured stream as a list of unicode strings.
+
+        See `iter_lines` for details.
+        """
+        return list(self.iter_lines(stream, keepends))
+
+    def _copy(self) -> Result:
+        """Return a copy sharing no mutable state with this result, and
+        without the traceback, which would keep the frames of the command
+        and of the test alive.
+
+        Raises:
+            TypeError: if the exception cannot be copied.
+        """
+        import copy
+
+        result = copy.copy(self)
+        result._text_cache = {}
+        result.metrics = copy.copy(self.metrics)
+        if self.exception is not None:
+            try:
+                exception = copy.copy(self.exception)
+            except Exception as e:
+                raise TypeError(f"cannot copy {self.exception!r}") from e
+            result.exception = exception
+            if self.exc_info is not None:
+                result.exc_info = t.cast(t.Any, (type(exception), exception, None))
+        return result
+
+    def __getstate__(self) -> dict[str, t.Any]:
+        # tracebacks cannot be pickled; keep the exception type and value so
+        # results can be sent back from worker processes
+        state = self.__dict__.copy()
+        state["_text_cache"] = {}
+        if self.exc_info is not None:
+            state["exc_info"] = (self.exc_info[0], self.exc_info[1], None)
+        return state
 
     def __repr__(self) -> str:
         exc_str = repr(self.exception) if self.exception else "okay"
         return f"<{type(self).__name__} {exc_str}>"
 
 
+class _Record:
+    """Base of the plain data classes below, compared and shown by the
+    attributes listed in `_fields`.  `dataclasses` is not used because
+    importing it takes longer than importing the rest of this module.
+    """
+
+    _fields: t.ClassVar[tuple[str, ...]] = ()
+
+    def __eq__(self, other: object) -> bool:
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, f) == getattr(other, f) for f in self._fields)
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self) -> str:
+        args = ", ".join(f"{f}={getattr(self, f)!r}" for f in self._fields)
+        return f"{type(self).__name__}({args})"
+
+
+class InvocationMetrics(_Record):
+    """Performance measurements of a single invocation, available as
+    `Result.metrics`.
+
+    The measurements cover the call of the CLI, not the setup of the
+    isolation around it.  CPU times are for the whole process, so they
+    include any other threads running at the same time.
+    """
+
+    #: Elapsed wall-clock time in seconds.
+    wall_time: float
+    #: User CPU time of the process in seconds.
+    user_time: float
+    #: System CPU time of the process in seconds.
+    system_time: float
+    #: Number of bytes written to ``"stdout"`` and ``"stderr"``.
+    bytes_written: dict[str, int]
+    #: Number of ``write`` calls to the binary ``"stdout"`` and ``"stderr"``
+    #: streams.  Writes through `sys.stdout` are buffered, so this is usually
+    #: lower than the number of ``print`` calls.
+    write_calls: dict[str, int]
+    #: Peak memory allocated by Python during the call in bytes, if the
+    #: runner was created with ``trace_memory=True``.
+    peak_memory: int | None = None
+    #: Memory allocated during the call and still allocated after it, if the
+    #: runner was created with ``trace_allocations=True``.
+    allocations: AllocationDiff | None
+
+    _fields = (
+        "wall_time",
+        "user_time",
+        "system_time",
+        "bytes_written",
+        "write_calls",
+        "peak_memory",
+        "allocations",
+    )
+
+    def __init__(
+        self,
+        wall_time: float,
+        user_time: float,
+        system_time: float,
+        bytes_written: dict[str, int],
+        write_calls: dict[str, int],
+        peak_memory: int | None = None,
+        allocations: AllocationDiff | None = None,
+    ) -> None:
+        self.wall_time = wall_time
+        self.user_time = user_time
+        self.system_time = system_time
+        self.bytes_written = bytes_written
+        self.write_calls = write_calls
+        self.peak_memory = peak_memory
+        self.allocations = allocations
+
+
+# allocations made by these files, and by `tracemalloc`, are left out of
+# `AllocationDiff`
+_UNTRACKED_FILES = (
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "*"),
+    "<frozen importlib._bootstrap>",
+    "<frozen importlib._bootstrap_external>",
+    "<unknown>",
+)
+
+
+class AllocationDiff(_Record):
+    """Memory allocated by a command and not freed when it returns, by the
+    source line that allocated it, from `tracemalloc` snapshots.
+
+    Allocations by `clirunner` itself, such as the captured output, and by
+    the import system are left out.
+    """
+
+    #: The differences between the snapshots, one per source line.
+    statistics: list[tracemalloc.StatisticDiff]
+
+    _fields = ("statistics",)
+
+    def __init__(self, statistics: list[tracemalloc.StatisticDiff]) -> None:
+        self.statistics = statistics
+
+    @classmethod
+    def compare(
+        cls, before: tracemalloc.Snapshot, after: tracemalloc.Snapshot
+    ) -> AllocationDiff:
+        import tracemalloc
+
+        filters = [
+            tracemalloc.Filter(False, pattern)
+            for pattern in (tracemalloc.__file__, *_UNTRACKED_FILES)
+        ]
+        statistics = after.filter_traces(filters).compare_to(
+            before.filter_traces(filters), "lineno"
+        )
+        return cls([stat for stat in statistics if stat.size_diff or stat.count_diff])
+
+    @property
+    def net_bytes(self) -> int:
+        """The number of bytes retained, negative if more were freed."""
+        return sum(stat.size_diff for stat in self.statistics)
+
+    @property
+    def net_blocks(self) -> int:
+        """The number of memory blocks retained."""
+        return sum(stat.count_diff for stat in self.statistics)
+
+    def top(self, limit: int = 10) -> list[tracemalloc.StatisticDiff]:
+        """Returns the `limit` source lines which retained the most memory."""
+        grown = [stat for stat in self.statistics if stat.size_diff > 0]
+        return sorted(grown, key=lambda stat: stat.size_diff, reverse=True)[:limit]
+
+    def __str__(self) -> str:
+        lines = [f"{self.net_bytes} bytes in {self.net_blocks} blocks retained"]
+        for stat in self.top():
+            frame = stat.traceback[0]
+            lines.append(
+                f"  {frame.filename}:{frame.lineno}: +{stat.size_diff} bytes"
+                f" in {stat.count_diff} blocks"
+            )
+        return "\n".join(lines)
+
+
+class BenchmarkStats(_Record):
+    """Statistics of the rounds of `CliRunner.bench`, in seconds."""
+
+    #: Wall-clock time of every timed round, in order.
+    times: list[float]
+    #: Peak memory allocated by Python during an extra traced round in bytes,
+    #: if it was measured.
+    peak_memory: int | None
+
+    _fields = ("times", "peak_memory")
+
+    def __init__(self, times: list[float], peak_memory: int | None = None) -> None:
+        self.times = times
+        self.peak_memory = peak_memory
+
+    @property
+    def rounds(self) -> int:
+        return len(self.times)
+
+    @property
+    def min(self) -> float:
+        return min(self.times)
+
+    @property
+    def max(self) -> float:
+        return max(self.times)
+
+    @property
+    def mean(self) -> float:
+        import statistics
+
+        return statistics.fmean(self.times)
+
+    @property
+    def median(self) -> float:
+        import statistics
+
+        return statistics.median(self.times)
+
+    @property
+    def p95(self) -> float:
+        """The 95th percentile, by the nearest-rank method."""
+        ordered = sorted(self.times)
+        return ordered[math.ceil(0.95 * len(ordered)) - 1]
+
+    @property
+    def stddev(self) -> float:
+        """The sample standard deviation, 0 for a single round."""
+        import statistics
+
+        return statistics.stdev(self.times) if len(self.times) > 1 else 0.0
+
+    @property
+    def ops_per_sec(self) -> float:
+        return 1 / self.mean if self.mean else math.inf
+
+    def __str__(self) -> str:
+        text = (
+            f"{self.rounds} rounds: min {self.min * 1e6:.1f}us"
+            f" median {self.median * 1e6:.1f}us p95 {self.p95 * 1e6:.1f}us"
+            f" stddev {self.stddev * 1e6:.1f}us, {self.ops_per_sec:.1f} ops/s"
+        )
+        if self.peak_memory is not None:
+            text += f", peak memory {self.peak_memory} bytes"
+        return text
+
+
+class _MetricsRecorder:
+    """Measures an invocation for `InvocationMetrics`."""
+
+    def __init__(self, trace_memory: bool, trace_allocations: bool = False) -> None:
+        self._trace_memory = trace_memory
+        self._trace_allocations = trace_allocations
+        self._snapshot: tracemalloc.Snapshot | None = None
+        self._started_tracing = False
+        self._baseline = 0
+        self._start = 0.0
+        self._times = os.times()
+
+    def start(self) -> None:
+        if self._trace_memory or self._trace_allocations:
+            import tracemalloc
+
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            if self._trace_allocations:
+                self._snapshot = tracemalloc.take_snapshot()
+            tracemalloc.reset_peak()
+            self._baseline = tracemalloc.get_traced_memory()[0]
+        self._times = os.times()
+        self._start = time.perf_counter()
+
+    def stop(self, mixer: StreamMixer) -> InvocationMetrics:
+        wall_time = time.perf_counter() - self._start
+        times = os.times()
+        peak_memory = None
+        allocations = None
+        if self._trace_memory or self._trace_allocations:
+            import tracemalloc
+
+            if self._trace_memory:
+                peak_memory = tracemalloc.get_traced_memory()[1] - self._baseline
+            if self._snapshot is not None:
+                allocations = AllocationDiff.compare(
+                    self._snapshot, tracemalloc.take_snapshot()
+                )
+                self._snapshot = None
+            if self._started_tracing:
+                tracemalloc.stop()
+        return InvocationMetrics(
+            wall_time=wall_time,
+            user_time=times.user - self._times.user,
+            system_time=times.system - self._times.system,
+            bytes_written=dict(mixer.bytes_written),
+            write_calls=dict(mixer.write_calls),
+            peak_memory=peak_memory,
+            allocations=allocations,
+        )
+
+
+class _Interrupted(BaseException):
+    """Raised inside the CLI by `_Watchdog`.
+
+    Derives from `BaseException` so that the CLI's own ``except Exception``
+    handlers do not swallow it.
+    """
+
+
+class _Watchdog:
+    """Interrupts the calling thread with `_Interrupted` after `timeout`
+    seconds, recording the stack it was interrupted at.
+
+    In the main thread of platforms with `signal.setitimer` this uses a
+    ``SIGALRM`` timer, which also interrupts blocking calls.  A timer that
+    was already running, such as the one of ``pytest-timeout``, is restarted
+    with its remaining time afterwards.  Elsewhere a timer thread raises the
+    exception asynchronously in the calling thread, which only happens once
+    it next executes Python bytecode.
+
+    Both the signal handler and the asynchronous exception only run when
+    the interpreter checks for pending events.  Python 3.10 does not check
+    in some loops which make no calls, e.g. ``while True: pass`` inside a
+    ``try`` block, so such a loop is never interrupted.
+    """
+
+    def __init__(self, timeout: float) -> None:
+        import threading
+
+        self.timeout = timeout
+        self.stack = ""
+        self._lock = threading.Lock()
+        self._done = False
+        self._fired = False
+        self._ident = threading.get_ident()
+        self._timer: threading.Timer | None = None
+        self._old_handler: t.Any = None
+        self._old_timer = (0.0, 0.0)
+        self._start = 0.0
+
+    def __enter__(self) -> _Watchdog:
+        import signal
+        import threading
+
+        if threading.current_thread() is threading.main_thread() and hasattr(
+            signal, "setitimer"
+        ):
+            self._old_handler = signal.signal(signal.SIGALRM, self._on_alarm)
+            self._start = time.monotonic()
+            self._old_timer = signal.setitimer(signal.ITIMER_REAL, self.timeout)
+        else:
+            self._timer = threading.Timer(self.timeout, self._on_timer)
+            self._timer.daemon = True
+            self._timer.start()
+        return self
+
+    def __exit__(self, *exc_info: t.Any) -> None:
+        import signal
+
+        if self._timer is None:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            if self._old_handler is None:
+                # the previous handler was not installed from Python
+                self._old_handler = signal.SIG_DFL
+            signal.signal(signal.SIGALRM, self._old_handler)
+            delay, interval = self._old_timer
+            if delay > 0:
+                # restart the outer timer, firing at once if it is overdue
+                remaining = delay - (time.monotonic() - self._start)
+                signal.setitimer(
+                    signal.ITIMER_REAL, max(remaining, 1e-6), interval
+                )
+            return
+        with self._lock:
+            self._done = True
+            self._timer.cancel()
+            if self._fired and exc_info[0] is not _Interrupted:
+                # the CLI ended before the pending exception was raised
+                _set_async_exc(self._ident, None)
+
+    def _on_alarm(self, signum: int, frame: FrameType | None) -> None:
+        import traceback
+
+        self.stack = "".join(traceback.format_stack(frame))
+        raise _Interrupted
+
+    def _on_timer(self) -> None:
+        with self._lock:
+            if self._done:
+                return
+            import traceback
+
+            frame = sys._current_frames().get(self._ident)
+            self.stack = "".join(traceback.format_stack(frame))
+            self._fired = True
+            _set_async_exc(self._ident, _Interrupted)
+
+
+class _Aborted(BaseException):
+    """Raised inside the CLI by `_OutputHook` to stop the invocation."""
+
+
+class _OutputHook:
+    """Passes captured output to an ``on_output`` callback and stops the
+    invocation with `_Aborted` the first time the callback returns `True`.
+    """
+
+    def __init__(self, callback: t.Callable[[str, bytes], t.Any]) -> None:
+        self.callback = callback
+        #: Set to False once the CLI returned so the final flush cannot abort.
+        self.active = True
+        self.aborted: tuple[str, bytes] | None = None
+
+    def __call__(self, stream: str, chunk: bytes) -> None:
+        if self.callback(stream, chunk) and self.active and self.aborted is None:
+            self.aborted = (stream, chunk)
+            raise _Aborted
+
+
+def _set_async_exc(ident: int, exc: type[BaseException] | None) -> None:
+    """Raise `exc` in the thread `ident`, or clear a pending exception if None."""
+    import ctypes
+
+    ctypes.pythonapi.PyThreadState_SetAsyncExc(
+        ctypes.c_ulong(ident), ctypes.py_object(exc) if exc else None
+    )
+
+
+class _PipeInput(io.RawIOBase):
+    """A readable raw stream fed with data from another thread.
+
+    Reads block until data is fed or the input is ended.  `before_wait` is
+    called whenever a read is about to block.
+    """
+
+    def __init__(self, before_wait: t.Callable[[], t.Any] | None = None) -> None:
+        import threading
+
+        super().__init__()
+        self._before_wait = before_wait
+        self._data = bytearray()
+        self._eof = False
+        self._cond = threading.Condition()
+
+    def readable(self) -> bool:
+        return True
+
+    def feed(self, data: bytes) -> None:
+        with self._cond:
+            if self._eof:
+                raise ValueError("input already ended")
+            self._data += data
+            self._cond.notify_all()
+
+    def end(self) -> None:
+        with self._cond:
+            self._eof = True
+            self._cond.notify_all()
+
+    def readinto(self, buffer: t.Any) -> int:
+        with self._cond:
+            waiting = not self._data and not self._eof
+        if waiting and self._before_wait is not None:
+            self._before_wait()
+        with self._cond:
+            while not self._data and not self._eof:
+                self._cond.wait()
+            size = min(len(buffer), len(self._data))
+            buffer[:size] = self._data[:size]
+            del self._data[:size]
+            return size
+
+
+def _flush_std_streams() -> None:
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+
+class InteractiveSession:
+    """A CLI running in a background thread which is driven by alternately
+    waiting for its output with `expect` and writing to its `<stdin>` with
+    `send`, like a user at a terminal.  Created by `CliRunner.interact`.
+
+    Whenever the CLI blocks reading `<stdin>`, everything it wrote so far is
+    flushed, so prompts are visible to `expect` even without a newline.
+
+    Args:
+        runner: the runner used to invoke the CLI.
+        cli: the command to invoke.
+        args: the arguments to invoke, as for `CliRunner.invoke`.
+        env: the environment overrides.
+        catch_exceptions: Whether to catch any other exceptions than
+            ``SystemExit``.
+        timeout: the default number of seconds `expect` and `wait` wait.
+        extra: extra keyword arguments for `CliRunner.invoke`.
+    """
+
+    def __init__(
+        self,
+        runner: CliRunner,
+        cli: t.Callable[..., t.Any],
+        args: str | cabc.Sequence[str] | None = None,
+        env: cabc.Mapping[str, str | None] | None = None,
+        catch_exceptions: bool = True,
+        timeout: float = 10,
+        extra: dict[str, t.Any] | None = None,
+    ) -> None:
+        import threading
+
+        self.runner = runner
+        self.timeout = timeout
+        #: The output between the end of the previous match and the start
+        #: of the last match of `expect`.
+        self.before = ""
+        self._stdin = _PipeInput(before_wait=_flush_std_streams)
+        self._cond = threading.Condition()
+        self._decoder = codecs.getincrementaldecoder(runner.charset)("replace")
+        self._text = ""
+        self._pos = 0
+        self._done = False
+        self._result: Result | None = None
+        self._error: BaseException | None = None
+        self._thread = threading.Thread(
+            target=self._run,
+            args=(cli, args, env, catch_exceptions, extra or {}),
+            name="clirunner-interact",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def _run(
+        self,
+        cli: t.Callable[..., t.Any],
+        args: str | cabc.Sequence[str] | None,
+        env: cabc.Mapping[str, str | None] | None,
+        catch_exceptions: bool,
+        extra: dict[str, t.Any],
+    ) -> None:
+        try:
+            with self.runner._invocation(
+                cli,
+                args,
+                io.BufferedReader(self._stdin),
+                env,
+                catch_exceptions,
+                extra,
+                True,
+                on_output=self._on_output,
+            ) as invocation:
+                invocation.return_value = cli()
+            self._result = invocation.result()
+        except BaseException as e:
+            self._error = e
+        finally:
+            with self._cond:
+                self._text += self._decoder.decode(b"", final=True)
+                self._done = True
+                self._cond.notify_all()
+
+    def _on_output(self, stream: str, chunk: bytes) -> None:
+        with self._cond:
+            self._text += self._decoder.decode(chunk)
+            self._cond.notify_all()
+
+    @property
+    def output(self) -> str:
+        """All output of the CLI so far."""
+        with self._cond:
+            return self._text
+
+    def expect(
+        self, pattern: str | re.Pattern[str], timeout: float | None = None
+    ) -> re.Match[str]:
+        """Wait until the output after the previous match matches the regular
+        expression `pattern` and return the match.
+
+        Raises:
+            EOFError: if the CLI exits without producing matching output.
+            TimeoutError: if there is no matching output within `timeout`
+                seconds, by default the session `timeout`.
+        """
+        regex = re.compile(pattern)
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        with self._cond:
+            while True:
+                match = regex.search(self._text, self._pos)
+                if match is not None:
+                    self.before = self._text[self._pos : match.start()]
+                    self._pos = match.end()
+                    return match
+                unmatched = self._text[self._pos :]
+                if self._done:
+                    raise EOFError(
+                        f"CLI exited before {regex.pattern!r} was seen in {unmatched!r}"
+                    )
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(
+                        f"Timed out waiting for {regex.pattern!r} in {unmatched!r}"
+                    )
+                self._cond.wait(remaining)
+
+    def send(self, data: str | bytes) -> None:
+        """Write `data` to the `<stdin>` of the CLI."""
+        if isinstance(data, str):
+            data = data.encode(self.runner.charset)
+        self._stdin.feed(data)
+
+    def sendline(self, line: str = "") -> None:
+        """Write `line` followed by a newline to the `<stdin>` of the CLI."""
+        self.send(f"{line}\n")
+
+    def close(self) -> None:
+        """End the `<stdin>` of the CLI; further reads return end of file."""
+        self._stdin.end()
+
+    def wait(self, timeout: float | None = None) -> Result:
+        """End the `<stdin>` of the CLI, wait for it to exit and return its
+        `Result`.
+
+        Raises:
+            TimeoutError: if the CLI does not exit within `timeout` seconds,
+                by default the session `timeout`.
+        """
+        self.close()
+        self._thread.join(self.timeout if timeout is None else timeout)
+        if self._thread.is_alive():
+            raise TimeoutError("CLI did not exit")
+        if self._error is not None:
+            raise self._error
+        assert self._result is not None
+        return self._result
+
+    def __enter__(self) -> InteractiveSession:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        if exc_type is None:
+            self.wait()
+        else:
+            self.close()
+
+
+class _Invocation:
+    """The state of a single invocation while `CliRunner` runs it."""
+
+    def __init__(self, runner: CliRunner) -> None:
+        self.runner = runner
+        self.return_value: t.Any = None
+        self.exit_code = 0
+        self.exception: BaseException | None = None
+        self.exc_info: (
+            tuple[type[BaseException], BaseException, TracebackType]
+            | tuple[None, None, None]
+            | None
+        ) = None
+        self.stdout: bytes | CapturedBytes | _Spans = b""
+        self.stderr: bytes | CapturedBytes | _Spans = b""
+        self.output: bytes | CapturedBytes = b""
+        self.metrics: InvocationMetrics | None = None
+        self.profile: t.Any = None
+        self.profiling: _profile.Profiling | None = None
+
+    def call(self, cli: t.Callable[[], t.Any]) -> t.Any:
+        """Call `cli`, with profiling if requested."""
+        if self.profiling is None:
+            return cli()
+        return self.profiling.call(cli)
+
+    def result(self) -> Result:
+        return Result(
+            runner=self.runner,
+            stdout_bytes=self.stdout,
+            stderr_bytes=self.stderr,
+            output_bytes=self.output,
+            return_value=self.return_value,
+            exit_code=self.exit_code,
+            exception=self.exception,
+            exc_info=self.exc_info,  # type: ignore
+            metrics=self.metrics,
+            profile=self.profile,
+        )
+
+
 class CliRunner:
     """The CLI runner provides functionality to invoke a command line
-    script for unit testing purposes in a isolated environment.  This only
-    works in single-threaded systems without any concurrency as it changes the
-    global interpreter state.
+    script for unit testing purposes in a isolated environment.  By default
+    this only works in single-threaded systems without any concurrency as it
+    changes the global interpreter state; see `concurrent` for running
+    invocations in parallel.
 
     Args:
         charset: the character set for the input and output data.
@@ -202,6 +1548,66 @@ class CliRunner:
         echo_stdin: if this is set to `True`, then reading from `<stdin>` writes
             to `<stdout>`.  This is useful for showing examples in
             some circumstances.
+        capture: how output is captured. ``"memory"`` (the default) keeps all
+            output in memory.  ``"spool"`` keeps output in memory until it
+            grows beyond `spool_threshold` bytes and then moves it to a
+            temporary file; the `Result` byte attributes are then
+            memory-mapped `CapturedBytes` views of that file.
+        spool_threshold: the number of bytes of output kept in memory before
+            spooling to disk when `capture` is ``"spool"``.
+        zero_copy: if `True`, the `Result` byte attributes are `CapturedBytes`
+            views of the in-memory capture buffer instead of copies.  Output
+            spooled to disk is always returned as views.
+        concurrent: if `True`, `sys.stdin`, `sys.stdout`, `sys.stderr`,
+            `sys.argv` and `os.environ` are replaced with proxies for the
+            duration of the invocation which route to the isolated state of
+            the current thread or asyncio task, so invocations can run in
+            parallel.  Threads started by the invoked CLI itself, subprocesses
+            and code that writes to the underlying file descriptors do not
+            see the isolated state.
+        fork: if `True`, every invocation runs in a forked child process so
+            that changes to `sys.modules`, module globals or `os.environ`
+            made by the CLI do not leak into the test process.  Callables
+            that can be pickled by reference are run by children of a zygote
+            process which imports their module once and receives the current
+            working directory, `os.environ` and `sys.path` with every call;
+            other changes to module state made by the test after the zygote
+            started, e.g. with ``monkeypatch.setattr``, are not seen.  Other
+            callables run in a child forked from the test process.  Only
+            available on platforms that support `os.fork`.
+        trace_memory: if `True`, `tracemalloc` is used to record the peak
+            memory allocated by each invocation in `Result.metrics`.  This
+            slows down the invoked CLI considerably.
+        trace_allocations: if `True`, `tracemalloc` snapshots are taken
+            before and after each invocation, and the memory allocated by the
+            CLI and not freed when it returns is recorded as an
+            `AllocationDiff` in `Result.allocations`.  This slows down the
+            invoked CLI considerably.
+        filesystem: where `isolated_filesystem` creates its directories.
+            ``"disk"`` (the default) uses the system temporary directory.
+            ``"memory"`` uses the RAM-backed `memory_dir` instead, and falls
+            back to the system temporary directory if it does not exist or
+            has less than `memory_min_free` bytes free.
+        memory_dir: the RAM-backed directory used when `filesystem` is
+            ``"memory"``, by default ``/dev/shm``.
+        memory_min_free: the number of bytes that must be free in
+            `memory_dir` for it to be used.
+        cleanup: how `isolated_filesystem` removes its directories.
+            ``"background"`` (the default) renames the directory away, which
+            is instant, and deletes it in a background thread; all such
+            directories are deleted before the interpreter exits.
+            ``"sync"`` deletes the directory before the block exits.
+        cache: if `True`, a `ResultCache` or a `DiskResultCache`, results of
+            `invoke` are cached and an identical invocation returns a copy of
+            the cached `Result`, without the traceback of its exception,
+            without running the command again.  `True` uses an
+            in-memory cache shared by all runners in the process; a
+            `DiskResultCache` persists results across test sessions.
+            Invocations are identical if they use the same function code,
+            arguments, input, environment and runner options; only use this
+            for commands whose result depends on nothing else.  Invocations
+            with input from a stream, file or iterable, with `on_output`, or
+            which time out are not cached.
     """
 
     def __init__(
@@ -209,10 +1615,59 @@ class CliRunner:
         charset: str = "utf-8",
         env: cabc.Mapping[str, str | None] | None = None,
         echo_stdin: bool = False,
+        capture: t.Literal["memory", "spool"] = "memory",
+        spool_threshold: int = 16 * 1024 * 1024,
+        zero_copy: bool = False,
+        concurrent: bool = False,
+        fork: bool = False,
+        trace_memory: bool = False,
+        trace_allocations: bool = False,
+        cache: bool | ResultCache | DiskResultCache = False,
+        filesystem: t.Literal["disk", "memory"] = "disk",
+        memory_dir: str | os.PathLike[str] | None = None,
+        memory_min_free: int = 64 * 1024 * 1024,
+        cleanup: t.Literal["background", "sync"] = "background",
     ) -> None:
+        if capture not in ("memory", "spool"):
+            raise ValueError(f"Unknown capture mode {capture!r}")
+        if filesystem not in ("disk", "memory"):
+            raise ValueError(f"Unknown filesystem {filesystem!r}")
+        if cleanup not in ("background", "sync"):
+            raise ValueError(f"Unknown cleanup mode {cleanup!r}")
+        if fork and not hasattr(os, "fork"):
+            raise ValueError("fork is not supported on this platform")
         self.charset = charset
         self.env: cabc.Mapping[str, str | None] = env or {}
         self.echo_stdin = echo_stdin
+        self.capture = capture
+        self.spool_threshold = spool_threshold
+        self.zero_copy = zero_copy
+        self.concurrent = concurrent
+        self.fork = fork
+        self.trace_memory = trace_memory
+        self.trace_allocations = trace_allocations
+        self.cache: ResultCache | DiskResultCache | None
+        if cache is True:
+            from ._cache import shared_cache
+
+            self.cache = shared_cache
+        elif cache is False:
+            self.cache = None
+        else:
+            self.cache = cache
+        self.filesystem = filesystem
+        self.memory_dir = memory_dir
+        self.memory_min_free = memory_min_free
+        self.cleanup = cleanup
+        # the directories of the active `isolated_filesystem` blocks
+        self._filesystems: list[str] = []
+
+    def __getstate__(self) -> dict[str, t.Any]:
+        # the cache stays in this process; runners sent to forked children or
+        # worker processes only run the command and return the result here
+        state = self.__dict__.copy()
+        state["cache"] = None
+        return state
 
     def get_default_prog_name(self, cli: t.Callable[..., t.Any]) -> str:
         """Given a callable return the default program name for it."""
@@ -235,10 +1690,10 @@ class CliRunner:
     @contextlib.contextmanager
     def isolation(
         self,
-        input: str | bytes | t.IO[t.Any] | None = None,
+        input: _InputSource | None = None,
         env: cabc.Mapping[str, str | None] | None = None,
         # color: bool = False,
-    ) -> cabc.Iterator[tuple[io.BytesIO, io.BytesIO, io.BytesIO]]:
+    ) -> cabc.Iterator[tuple[_CaptureStream, _CaptureStream, _CaptureStream]]:
         """A context manager that sets up the isolation for invoking of a
         command line tool.  This sets up `<stdin>` with the given input data
         and `os.environ` with the overrides from the given dictionary.
@@ -250,9 +1705,18 @@ class CliRunner:
             env: the environment overrides as dictionary.
         """
         # TODO: I don't think we need this color parameter as that is Click specific
+        with self._isolation(input, env, self.concurrent) as outstreams:
+            yield outstreams
 
+    @contextlib.contextmanager
+    def _isolation(
+        self,
+        input: _InputSource | None,
+        env: cabc.Mapping[str, str | None] | None,
+        concurrent: bool,
+        on_output: t.Callable[[str, bytes], t.Any] | None = None,
+    ) -> cabc.Iterator[tuple[_CaptureStream, _CaptureStream, _CaptureStream]]:
         bytes_input = make_input_stream(input, self.charset)
-        echo_input = None
 
         old_stdin = sys.stdin
         old_stdout = sys.stdout
@@ -260,34 +1724,69 @@ class CliRunner:
 
         env = self.make_env(env)
 
-        stream_mixer = StreamMixer()
-
-        if self.echo_stdin:
-            bytes_input = echo_input = t.cast(
-                t.BinaryIO, EchoingStdin(bytes_input, stream_mixer.stdout)
-            )
-
-        sys.stdin = text_input = _NamedTextIOWrapper(
-            bytes_input, encoding=self.charset, name="<stdin>", mode="r"
+        stream_mixer = StreamMixer(
+            spool_threshold=self.spool_threshold if self.capture == "spool" else None
         )
+        stream_mixer.on_write = on_output
+        # with an output callback, pass every line on as soon as it is written
+        line_buffering = on_output is not None
 
-        if self.echo_stdin:
-            # Force unbuffered reads, otherwise TextIOWrapper reads a
-            # large chunk which is echoed early.
-            text_input._CHUNK_SIZE = 1  # type: ignore
-
-        sys.stdout = _NamedTextIOWrapper(
-            stream_mixer.stdout, encoding=self.charset, name="<stdout>", mode="w"
+        text_output = _NamedTextIOWrapper(
+            t.cast(t.BinaryIO, stream_mixer.stdout),
+            encoding=self.charset,
+            name="<stdout>",
+            mode="w",
+            line_buffering=line_buffering,
         )
 
-        sys.stderr = _NamedTextIOWrapper(
-            stream_mixer.stderr,
+        text_error = _NamedTextIOWrapper(
+            t.cast(t.BinaryIO, stream_mixer.stderr),
             encoding=self.charset,
             name="<stderr>",
             mode="w",
             errors="backslashreplace",
+            line_buffering=line_buffering,
         )
 
+        text_input: _NamedTextIOWrapper
+        if self.echo_stdin:
+            text_input = _EchoingTextIOWrapper(
+                bytes_input,
+                text_output,
+                encoding=self.charset,
+                name="<stdin>",
+                mode="r",
+            )
+        else:
+            text_input = _NamedTextIOWrapper(
+                bytes_input, encoding=self.charset, name="<stdin>", mode="r"
+            )
+
+        outstreams = (stream_mixer.stdout, stream_mixer.stderr, stream_mixer.output)
+
+        if concurrent:
+            environ = dict(os.environ)
+            for key, value in env.items():
+                if value is None:
+                    environ.pop(key, None)
+                else:
+                    environ[key] = value
+            from . import _context
+
+            with _context.isolated(
+                stdin=text_input,
+                stdout=text_output,
+                stderr=text_error,
+                argv=list(sys.argv),
+                environ=environ,
+            ):
+                yield outstreams
+            return
+
+        sys.stdin = text_input
+        sys.stdout = text_output
+        sys.stderr = text_error
+
         # default_color = color
 
         # def should_strip_ansi(
@@ -311,7 +1810,7 @@ class CliRunner:
                         pass
                 else:
                     os.environ[key] = value
-            yield (stream_mixer.stdout, stream_mixer.stderr, stream_mixer.output)
+            yield outstreams
         finally:
             for key, value in old_env.items():
                 if value is None:
@@ -330,10 +1829,13 @@ class CliRunner:
         self,
         cli: t.Callable[..., t.Any],
         args: str | cabc.Sequence[str] | None = None,
-        input: str | bytes | t.IO[t.Any] | None = None,
+        input: _InputSource | None = None,
         env: cabc.Mapping[str, str | None] | None = None,
         catch_exceptions: bool = True,
         # color: bool = False,
+        timeout: float | None = None,
+        on_output: t.Callable[[str, bytes], t.Any] | None = None,
+        profile: bool | str | t.Callable[[], t.Any] = False,
         **extra: t.Any,
     ) -> Result:
         """Invokes a command in an isolated environment.  The arguments are
@@ -345,20 +1847,267 @@ class CliRunner:
                 or a string. When given as string it will be interpreted
                 as a Unix shell command. More details at
                 `shlex.split`.
+            input: the input data for `sys.stdin`.  This may be a string,
+                bytes, a file object, a `pathlib.Path` or `FileInput` for a
+                file which is memory-mapped, or an iterable or async iterable
+                of string or bytes chunks which is only consumed as the
+                command reads from `sys.stdin`.
+            env: the environment overrides.
+            catch_exceptions: Whether to catch any other exceptions than
+                ``SystemExit``.
+            timeout: if given, the command is interrupted if it does not
+                finish within this many seconds and the result holds an
+                `InvocationTimeout` exception recording where the command
+                was stuck.
+            on_output: if given, called as ``on_output(stream, chunk)`` with
+                the stream name (``"stdout"`` or ``"stderr"``) and the bytes of
+                every write while the command runs.  `sys.stdout` and
+                `sys.stderr` are line buffered so lines are passed on as soon
+                as they are written.  If the callback returns `True`, the
+                command is stopped and the result holds an
+                `InvocationAborted` exception.  Not supported with `fork`.
+            profile: if `True` or ``"cprofile"``, the call of the command,
+                without the setup of the isolation around it, is profiled
+                with `cProfile` and `Result.profile` holds its
+                `ProfileStats`.  If a callable is given, it is called to
+                create a profiler which is used as a context manager around
+                the call, such as ``pyinstrument.Profiler``, and
+                `Result.profile` holds the value it returns when entered.
+                Profiled invocations are not cached.
+
+        Returns: `Result` object with results of the invocation.
+        """
+        if self.fork and on_output is not None:
+            raise ValueError("on_output is not supported with fork")
+        key = None
+        if self.cache is not None and on_output is None and not profile:
+            key = self._cache_key(cli, args, input, env, catch_exceptions, extra)
+            if key is not None:
+                cached = self.cache.get(key)
+                if cached is not None:
+                    result = t.cast(Result, cached)._copy()
+                    result.runner = self
+                    return result
+        if self.fork:
+            result = self._invoke_forked(
+                cli,
+                args,
+                input,
+                env,
+                catch_exceptions,
+                {**extra, "timeout": timeout, "profile": profile},
+            )
+        else:
+            result = self._invoke(
+                cli,
+                args,
+                input,
+                env,
+                catch_exceptions,
+                timeout=timeout,
+                on_output=on_output,
+                profile=profile,
+                **extra,
+            )
+        if key is not None:
+            from ._fork import ChildCrashedError
+            from .exceptions import InvocationAborted, InvocationTimeout
+
+            assert self.cache is not None
+            if not isinstance(
+                result.exception,
+                (InvocationTimeout, InvocationAborted, ChildCrashedError),
+            ):
+                try:
+                    stored = result._copy()
+                except TypeError:
+                    return result
+                # the streams are joined from the output, or share its storage
+                self.cache.put(key, stored, len(result.output_bytes))
+        return result
+
+    def _cache_key(
+        self,
+        cli: t.Callable[..., t.Any],
+        args: str | cabc.Sequence[str] | None,
+        input: _InputSource | None,
+        env: cabc.Mapping[str, str | None] | None,
+        catch_exceptions: bool,
+        extra: dict[str, t.Any],
+    ) -> t.Hashable | None:
+        """Returns the key identifying an invocation in `cache`, or `None` if
+        the invocation cannot be cached.
+        """
+        from . import _cache
+
+        assert self.cache is not None
+        try:
+            parts = (
+                self.cache.callable_key(cli),
+                _cache.hashable(args),
+                _cache.input_key(input, self.charset),
+                _cache.hashable(sorted(self.make_env(env).items())),
+                _cache.hashable(sorted(extra.items())),
+            )
+        except TypeError:
+            return None
+        files = None
+        if self.cache.include_files and self._filesystems:
+            files = _cache.tree_digest(self._filesystems[-1])
+        options = (
+            self.charset,
+            self.echo_stdin,
+            self.capture,
+            self.zero_copy,
+            self.trace_memory,
+            self.trace_allocations,
+            catch_exceptions,
+        )
+        return (*parts, files, options)
+
+    def _invoke_forked(
+        self,
+        cli: t.Callable[..., t.Any],
+        args: str | cabc.Sequence[str] | None,
+        input: _InputSource | None,
+        env: cabc.Mapping[str, str | None] | None,
+        catch_exceptions: bool,
+        extra: dict[str, t.Any],
+    ) -> Result:
+        from . import _fork
+
+        try:
+            result = _fork.call(
+                _invoke_worker, self, cli, args, input, env, catch_exceptions, extra
+            )
+        except _fork.ChildCrashedError as e:
+            if not catch_exceptions:
+                raise
+            return Result(
+                runner=self,
+                stdout_bytes=b"",
+                stderr_bytes=b"",
+                output_bytes=b"",
+                return_value=None,
+                exit_code=e.exit_code or 1,
+                exception=e,
+            )
+        result.runner = self
+        return result
+
+    def _invoke(
+        self,
+        cli: t.Callable[..., t.Any],
+        args: str | cabc.Sequence[str] | None = None,
+        input: _InputSource | None = None,
+        env: cabc.Mapping[str, str | None] | None = None,
+        catch_exceptions: bool = True,
+        timeout: float | None = None,
+        on_output: t.Callable[[str, bytes], t.Any] | None = None,
+        profile: bool | str | t.Callable[[], t.Any] = False,
+        **extra: t.Any,
+    ) -> Result:
+        with self._invocation(
+            cli,
+            args,
+            input,
+            env,
+            catch_exceptions,
+            extra,
+            self.concurrent,
+            timeout,
+            on_output,
+            profile,
+        ) as invocation:
+            invocation.return_value = invocation.call(cli)
+        return invocation.result()
+
+    async def ainvoke(
+        self,
+        cli: t.Callable[..., t.Any],
+        args: str | cabc.Sequence[str] | None = None,
+        input: _InputSource | None = None,
+        env: cabc.Mapping[str, str | None] | None = None,
+        catch_exceptions: bool = True,
+        on_output: t.Callable[[str, bytes], t.Any] | None = None,
+        **extra: t.Any,
+    ) -> Result:
+        """Invokes a command in an isolated environment like `invoke`,
+        awaiting the value returned by `cli` if it is awaitable, e.g. when
+        `cli` is an ``async def`` function.
+
+        The command runs on the caller's event loop, always in the calling
+        process, with its streams, `sys.argv` and `os.environ` isolated per
+        asyncio task as with the `concurrent` option, so several invocations
+        can be awaited together with `asyncio.gather`.  The `timeout` and
+        `profile` options of `invoke` are not supported, as they would
+        interrupt or profile the whole event loop.
+
+        Args:
+            cli: the command to invoke
+            args: the arguments to invoke, as for `invoke`.
             input: the input data for `sys.stdin`.
             env: the environment overrides.
             catch_exceptions: Whether to catch any other exceptions than
                 ``SystemExit``.
+            on_output: called with every write of the command, as for
+                `invoke`.
+
+        Raises:
+            TypeError: if an unsupported keyword argument is given.
 
         Returns: `Result` object with results of the invocation.
         """
-        exc_info = None
-        with self.isolation(input=input, env=env) as outstreams:
-            return_value = None
-            exception: BaseException | None = None
-            exit_code = 0
+        import inspect
+
+        for name in extra:
+            if name != "prog_name":
+                raise TypeError(
+                    f"ainvoke() got an unexpected keyword argument {name!r}"
+                )
+        with self._invocation(
+            cli,
+            args,
+            input,
+            env,
+            catch_exceptions,
+            extra,
+            True,
+            on_output=on_output,
+        ) as invocation:
+            return_value = cli()
+            if inspect.isawaitable(return_value):
+                return_value = await return_value
+            invocation.return_value = return_value
+        return invocation.result()
 
+    @contextlib.contextmanager
+    def _invocation(
+        self,
+        cli: t.Callable[..., t.Any],
+        args: str | cabc.Sequence[str] | None,
+        input: _InputSource | None,
+        env: cabc.Mapping[str, str | None] | None,
+        catch_exceptions: bool,
+        extra: dict[str, t.Any],
+        concurrent: bool,
+        timeout: float | None = None,
+        on_output: t.Callable[[str, bytes], t.Any] | None = None,
+        profile: t.Any = None,
+    ) -> cabc.Iterator[_Invocation]:
+        """Set up the isolation for a single invocation of `cli`.
+
+        The body of the ``with`` block calls `cli` with `_Invocation.call`
+        and stores its return value on the yielded `_Invocation`; exceptions
+        raised by the call are turned into the exit code and exception of the
+        result.
+        """
+        invocation = _Invocation(self)
+        hook = _OutputHook(on_output) if on_output is not None else None
+        with self._isolation(input, env, concurrent, hook) as outstreams:
             if isinstance(args, str):
+                import shlex
+
                 args = shlex.split(args)
 
             try:
@@ -369,57 +2118,346 @@ class CliRunner:
             # set up sys.argv properly with the arguments
             call_args = args or []
             old_argv = sys.argv
-            sys.argv = [prog_name, *call_args]
+            if concurrent:
+                # sys.argv is a proxy for the argv of this invocation
+                sys.argv[:] = [prog_name, *call_args]
+            else:
+                sys.argv = [prog_name, *call_args]
+            recorder = _MetricsRecorder(
+                self.trace_memory, self.trace_allocations
+            )
+            watchdog = _Watchdog(timeout) if timeout is not None else None
+            if profile:
+                from ._profile import Profiling
+
+                invocation.profiling = Profiling(profile)
+            recorder.start()
             try:
-                return_value = cli()
+                try:
+                    with watchdog or contextlib.nullcontext():
+                        yield invocation
+                finally:
+                    if hook is not None and hook.aborted is not None:
+                        # also when the CLI caught `_Aborted` and carried on
+                        raise _Aborted
+                return_value = invocation.return_value
                 # If the command returns an integer, treat it as an exit code
                 if isinstance(return_value, int) and return_value != 0:
                     raise SystemExit(return_value)
             except SystemExit as e:
-                exc_info = sys.exc_info()
+                invocation.exc_info = sys.exc_info()
                 e_code = t.cast("int | t.Any | None", e.code)
 
                 if e_code is None:
                     e_code = 0
 
                 if e_code != 0:
-                    exception = e
+                    invocation.exception = e
 
                 if not isinstance(e_code, int):
                     sys.stdout.write(str(e_code))
                     sys.stdout.write("\n")
                     e_code = 1
 
-                exit_code = e_code
+                invocation.exit_code = e_code
+
+            except _Interrupted as e:
+                from .exceptions import InvocationTimeout
+
+                assert watchdog is not None
+                error = InvocationTimeout(watchdog.timeout, watchdog.stack)
+                if not catch_exceptions:
+                    raise error from None
+                invocation.exception = error
+                invocation.exit_code = 1
+                invocation.exc_info = (
+                    type(error),
+                    error,
+                    t.cast(TracebackType, e.__traceback__),
+                )
+
+            except _Aborted as e:
+                from .exceptions import InvocationAborted
+
+                assert hook is not None and hook.aborted is not None
+                aborted = InvocationAborted(*hook.aborted)
+                invocation.exception = aborted
+                invocation.exit_code = 1
+                invocation.exc_info = (
+                    type(aborted),
+                    aborted,
+                    t.cast(TracebackType, e.__traceback__),
+                )
 
             except Exception as e:
                 if not catch_exceptions:
                     raise
-                exception = e
-                exit_code = 1
-                exc_info = sys.exc_info()
+                invocation.exception = e
+                invocation.exit_code = 1
+                invocation.exc_info = sys.exc_info()
             finally:
-                sys.argv = old_argv
+                if hook is not None:
+                    hook.active = False
+                if not concurrent:
+                    sys.argv = old_argv
                 sys.stdout.flush()
                 sys.stderr.flush()
-                stdout = outstreams[0].getvalue()
-                stderr = outstreams[1].getvalue()
-                output = outstreams[2].getvalue()
+                mixer = outstreams[0]._mixer
+                invocation.metrics = recorder.stop(mixer)
+                if invocation.profiling is not None:
+                    invocation.profile = invocation.profiling.result()
+                if self.zero_copy or self.capture == "spool":
+                    invocation.stdout = mixer.getbuffer("stdout")
+                    invocation.stderr = mixer.getbuffer("stderr")
+                    invocation.output = mixer.getbuffer()
+                    mixer.release()
+                else:
+                    (
+                        invocation.stdout,
+                        invocation.stderr,
+                        invocation.output,
+                    ) = mixer.detach()
 
-        return Result(
-            runner=self,
-            stdout_bytes=stdout,
-            stderr_bytes=stderr,
-            output_bytes=output,
-            return_value=return_value,
-            exit_code=exit_code,
-            exception=exception,
-            exc_info=exc_info,  # type: ignore
+    def interact(
+        self,
+        cli: t.Callable[..., t.Any],
+        args: str | cabc.Sequence[str] | None = None,
+        env: cabc.Mapping[str, str | None] | None = None,
+        catch_exceptions: bool = True,
+        timeout: float = 10,
+        **extra: t.Any,
+    ) -> InteractiveSession:
+        """Starts a command in a background thread for interactive testing.
+
+        The command runs with the same isolation as `invoke`, routed per
+        thread as with the `concurrent` option.  Its `<stdin>` is fed by
+        `InteractiveSession.send` and its output is matched with
+        `InteractiveSession.expect`:
+
+        ```python
+        with runner.interact(prompt) as session:
+            session.expect("Foo: ")
+            session.sendline("bar")
+            session.expect("foo = bar")
+        assert session.wait().exit_code == 0
+        ```
+
+        Args:
+            cli: the command to invoke
+            args: the arguments to invoke, as for `invoke`.
+            env: the environment overrides.
+            catch_exceptions: Whether to catch any other exceptions than
+                ``SystemExit``.
+            timeout: the default number of seconds to wait for output or
+                for the command to exit.
+
+        Returns: `InteractiveSession` driving the command.
+        """
+        return InteractiveSession(
+            self, cli, args, env, catch_exceptions, timeout, extra
         )
 
+    def bench(
+        self,
+        cli: t.Callable[..., t.Any],
+        args: str | cabc.Sequence[str] | None = None,
+        input: str | bytes | os.PathLike[str] | None = None,
+        env: cabc.Mapping[str, str | None] | None = None,
+        rounds: int = 100,
+        warmup: int = 10,
+        memory: bool = True,
+        **extra: t.Any,
+    ) -> BenchmarkStats:
+        """Benchmarks a command by invoking it repeatedly in the current
+        process with the same isolation as `invoke`.
+
+        Each round times only the call of the command, as
+        `InvocationMetrics.wall_time` does.  The cache and `fork` options of
+        the runner are not used.
+
+        Args:
+            cli: the command to invoke
+            args: the arguments to invoke, as for `invoke`.
+            input: the input data for `sys.stdin` of every round.  Streams
+                and iterables cannot be given as they are consumed by the
+                first round.
+            env: the environment overrides.
+            rounds: the number of timed rounds.
+            warmup: the number of untimed rounds run first.
+            memory: if `True`, an extra round is run with `tracemalloc` to
+                measure the peak memory allocated.
+
+        Raises:
+            ValueError: if `rounds` is less than 1 or `input` is a stream
+                or iterable.
+
+        Returns: `BenchmarkStats` of the timed rounds.
+        """
+        if rounds < 1:
+            raise ValueError("rounds must be at least 1")
+        if input is not None and not isinstance(input, (str, bytes, os.PathLike)):
+            raise ValueError("input must be a string, bytes or a path")
+
+        def run(runner: CliRunner) -> Result:
+            return runner._invoke(cli, args, input, env, False, **extra)
+
+        for _ in range(warmup):
+            run(self)
+        times = []
+        for _ in range(rounds):
+            metrics = run(self).metrics
+            assert metrics is not None
+            times.append(metrics.wall_time)
+        peak_memory = None
+        if memory:
+            import copy
+
+            traced = copy.copy(self)
+            traced.trace_memory = True
+            metrics = run(traced).metrics
+            assert metrics is not None
+            peak_memory = metrics.peak_memory
+        return BenchmarkStats(times=times, peak_memory=peak_memory)
+
+    def assert_no_leak(
+        self,
+        cli: t.Callable[..., t.Any],
+        args: str | cabc.Sequence[str] | None = None,
+        input: str | bytes | os.PathLike[str] | None = None,
+        env: cabc.Mapping[str, str | None] | None = None,
+        iterations: int = 50,
+        warmup: int = 5,
+        max_growth: int = 4096,
+        **extra: t.Any,
+    ) -> AllocationDiff:
+        """Asserts that invoking a command repeatedly does not keep growing
+        the memory it retains, such as module level caches that gain an
+        entry on every invocation.
+
+        The command is invoked `warmup` times first so that imports and
+        caches which are filled once are not counted.  Then the memory
+        retained over `iterations` more invocations is compared with
+        `tracemalloc` snapshots.  The cache and `fork` options of the runner
+        are not used.
+
+        Args:
+            cli: the command to invoke
+            args: the arguments to invoke, as for `invoke`.
+            input: the input data for `sys.stdin` of every invocation.
+            env: the environment overrides.
+            iterations: the number of invocations measured.
+            warmup: the number of invocations before measuring.
+            max_growth: the number of bytes the measured invocations may
+                retain in total.
+
+        Raises:
+            AssertionError: if more than `max_growth` bytes were retained,
+                with the source lines that retained the most memory.
+
+        Returns: `AllocationDiff` of the measured invocations.
+        """
+        if input is not None and not isinstance(input, (str, bytes, os.PathLike)):
+            raise ValueError("input must be a string, bytes or a path")
+        for _ in range(warmup):
+            self._invoke(cli, args, input, env, False, **extra)
+        import gc
+        import tracemalloc
+
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        try:
+            gc.collect()
+            before = tracemalloc.take_snapshot()
+            for _ in range(iterations):
+                self._invoke(cli, args, input, env, False, **extra)
+            gc.collect()
+            diff = AllocationDiff.compare(before, tracemalloc.take_snapshot())
+        finally:
+            if started_tracing:
+                tracemalloc.stop()
+        if diff.net_bytes > max_growth:
+            raise AssertionError(
+                f"{iterations} invocations retained more than {max_growth}"
+                f" bytes: {diff}"
+            )
+        return diff
+
+    def invoke_many(
+        self,
+        cli: t.Callable[..., t.Any],
+        arg_sets: cabc.Iterable[str | cabc.Sequence[str] | None],
+        inputs: cabc.Iterable[str | bytes | None] | None = None,
+        env: cabc.Mapping[str, str | None] | None = None,
+        catch_exceptions: bool = True,
+        workers: int | None = None,
+        mp_context: str | None = None,
+        chunksize: int = 1,
+        **extra: t.Any,
+    ) -> list[Result]:
+        """Invokes a command once for each set of arguments, fanning the
+        invocations out across a pool of worker processes.  Each invocation
+        runs in the same isolated environment as `invoke`.
+
+        The command, arguments, inputs and returned values are sent between
+        processes with `pickle`, so `cli` must be importable by name, e.g. a
+        module-level function.  The ``exc_info`` of the returned results does
+        not include a traceback.
+
+        Args:
+            cli: the command to invoke
+            arg_sets: the arguments for each invocation, as accepted by `invoke`.
+            inputs: the input data for `sys.stdin` of each invocation.  If
+                given, it must have one entry per item of `arg_sets`.
+            env: the environment overrides for every invocation.
+            catch_exceptions: Whether to catch any other exceptions than
+                ``SystemExit``.
+            workers: the number of worker processes; defaults to the number
+                of CPUs.
+            mp_context: the `multiprocessing` start method for the workers,
+                e.g. ``"fork"`` or ``"forkserver"``; defaults to the platform
+                default.
+            chunksize: the number of invocations sent to a worker at a time.
+
+        Returns: list of `Result` objects, in the same order as `arg_sets`.
+        """
+        import concurrent.futures
+        import multiprocessing
+
+        arg_list = list(arg_sets)
+        if inputs is None:
+            input_list: list[str | bytes | None] = [None] * len(arg_list)
+        else:
+            input_list = list(inputs)
+            if len(input_list) != len(arg_list):
+                raise ValueError(
+                    f"Got {len(input_list)} inputs for {len(arg_list)} argument sets"
+                )
+
+        context = multiprocessing.get_context(mp_context) if mp_context else None
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, mp_context=context
+        ) as executor:
+            return list(
+                executor.map(
+                    _invoke_worker,
+                    itertools.repeat(self),
+                    itertools.repeat(cli),
+                    arg_list,
+                    input_list,
+                    itertools.repeat(env),
+                    itertools.repeat(catch_exceptions),
+                    itertools.repeat(extra),
+                    chunksize=chunksize,
+                )
+            )
+
     @contextlib.contextmanager
     def isolated_filesystem(
-        self, temp_dir: str | os.PathLike[str] | None = None
+        self,
+        temp_dir: str | os.PathLike[str] | None = None,
+        template: str | os.PathLike[str] | t.Callable[[str], t.Any] | None = None,
+        hardlink: bool = False,
     ) -> cabc.Iterator[str]:
         """A context manager that creates a temporary directory and
         changes the current working directory to it. This isolates tests
@@ -429,19 +2467,67 @@ class CliRunner:
         Args:
             temp_dir: Create the temporary directory under this
                 directory. If given, the created directory is not removed
-                when exiting.
+                when exiting.  Otherwise it is created as selected by the
+                runner's `filesystem` option.
+            template: a directory whose contents are copied into the
+                temporary directory.  Files are cloned with copy-on-write
+                reflinks where the file system supports them and copied
+                otherwise.  If a callable is given, it is called with an
+                empty directory to build the template the first time it is
+                used in the process, and the built template is reused for
+                later calls.
+            hardlink: if `True`, files from `template` are hard linked
+                instead of copied where reflinks are not supported.  The
+                command must then not modify these files in place, as that
+                changes the template too.
         """
+        import shutil
+        import tempfile
+
+        from . import _fs
+
         cwd = os.getcwd()
-        dt = tempfile.mkdtemp(dir=temp_dir)
+        parent = temp_dir
+        if parent is None and self.filesystem == "memory":
+            parent = _fs.memory_dir(self.memory_dir, self.memory_min_free)
+        dt = tempfile.mkdtemp(dir=parent)
+        if template is not None:
+            try:
+                if callable(template):
+                    template = _fs.golden(template)
+                _fs.copy_template(template, dt, hardlink)
+            except BaseException:
+                shutil.rmtree(dt, ignore_errors=True)
+                raise
         os.chdir(dt)
+        self._filesystems.append(dt)
 
         try:
             yield dt
         finally:
+            self._filesystems.remove(dt)
             os.chdir(cwd)
 
             if temp_dir is None:
-                try:
-                    shutil.rmtree(dt)
-                except OSError:  # noqa: B014
-                    pass
+                if self.cleanup == "background":
+                    _fs.trash.discard(dt)
+                else:
+                    try:
+                        shutil.rmtree(dt)
+                    except OSError:  # noqa: B014
+                        pass
+
+
+def _invoke_worker(
+    runner: CliRunner,
+    cli: t.Callable[..., t.Any],
+    args: str | cabc.Sequence[str] | None,
+    input: str | bytes | None,
+    env: cabc.Mapping[str, str | None] | None,
+    catch_exceptions: bool,
+    extra: dict[str, t.Any],
+) -> Result:
+    """Run a single invocation in a worker or forked child process."""
+    return runner._invoke(
+        cli, args, input=input, env=env, catch_exceptions=catch_exceptions, **extra
+    )
@@ -35,7 +35,12 @@ def task_build():
         ],
         "file_dep": [
             "clirunner/__init__.py",
+            "clirunner/_cache.py",
             "clirunner/_compat.py",
+            "clirunner/_context.py",
+            "clirunner/_fork.py",
+            "clirunner/_fs.py",
+            "clirunner/_profile.py",
             "clirunner/_winconsole.py",
             "clirunner/testing.py",
             "clirunner/utils.py",
@@ -50,6 +55,28 @@ def task_tests():
     return {"actions": ["python3 -m pytest tests/"]}
 
 
+def task_bench():
+    """Benchmark CliRunner.invoke overhead against the baseline"""
+    return {
+        "actions": [
+            "python3 benchmarks/bench_invoke.py --compare benchmarks/baseline.json"
+        ],
+        "verbosity": 2,
+        "uptodate": [False],
+    }
+
+
+def task_bench_baseline():
+    """Record a new benchmark baseline"""
+    return {
+        "actions": [
+            "python3 benchmarks/bench_invoke.py --save benchmarks/baseline.json"
+        ],
+        "verbosity": 2,
+        "uptodate": [False],
+    }
+
+
 def task_docs_deploy():
     """Deploy docs to GitHub pages"""
     return {
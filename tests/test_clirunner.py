@@ -1,16 +1,57 @@
 """Tests for CliRunner"""
 
 import argparse
+import asyncio
+import io
+import mmap
 import os
+import pstats
+import signal
+import stat
+import subprocess
 import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 
 import pytest
+from hello import hello
+from prompt import prompt
 
+from clirunner import DiskResultCache, ResultCache, _fs
 from clirunner._compat import WIN
-from clirunner.testing import CliRunner
+from clirunner.exceptions import InvocationAborted, InvocationTimeout
+from clirunner.testing import (
+    BenchmarkStats,
+    CapturedBytes,
+    CliRunner,
+    FileInput,
+    StreamMixer,
+    make_input_stream,
+)
 from clirunner.utils import get_binary_stream
 
+FORK_COUNTER = 0
+
+
+def fork_cli():
+    """Mutate process state that fork isolation should throw away."""
+    global FORK_COUNTER
+    FORK_COUNTER += 1
+    os.environ["CLIRUNNER_FORKED"] = "1"
+    sys.modules["clirunner_fork_dummy"] = sys
+    print(f"counter={FORK_COUNTER} pid={os.getpid()}")
+
+
+def fork_write_cli():
+    """Write a file in the working directory and print an environment value."""
+    with open("written.txt", "w") as f:
+        f.write("written")
+    print(os.environ.get("CLIRUNNER_FORK_VALUE"))
+
 
 def test_runner():
     def test():
@@ -294,3 +335,1232 @@ def test_isolation_stderr_errors():
     result = runner.invoke(cli_stderr)
     assert result.exit_code == 0
     assert result.stderr == "\\udce2"
+
+
+def test_stream_mixer_interleaved():
+    """Output is stored once and split per stream on demand."""
+    mixer = StreamMixer()
+    mixer.stdout.write(b"out1\n")
+    mixer.stderr.write(b"err1\n")
+    mixer.stdout.write(b"out2\n")
+    mixer.stdout.write(b"out3\n")
+
+    assert mixer.stdout.getvalue() == b"out1\nout2\nout3\n"
+    assert mixer.stderr.getvalue() == b"err1\n"
+    assert mixer.output.getvalue() == b"out1\nerr1\nout2\nout3\n"
+    assert mixer._size == len(mixer.output.getvalue())
+    assert len(mixer._chunks) == 3
+
+
+def test_output_shared_with_single_stream():
+    """A stream written alone returns the same bytes as the output."""
+
+    def cli():
+        print("hello")
+
+    result = CliRunner().invoke(cli)
+    assert result.stdout_bytes is result.output_bytes
+    assert result.stderr_bytes == b""
+
+    mixer = StreamMixer()
+    mixer.stdout.write(b"out\n")
+    mixer.stderr.write(b"err\n")
+    stdout, stderr, output = mixer.detach()
+    assert (stdout.join(), stderr.join(), output) == (b"out\n", b"err\n", b"out\nerr\n")
+    assert mixer._size == 0
+    assert not hasattr(mixer, "stdout")
+
+
+def test_interleaved_output_peak_memory():
+    """The captured bytes exist at most twice while the result is built."""
+    size = 8 * 1024 * 1024
+    chunk = b"x" * 1023 + b"\n"
+
+    def cli():
+        for i in range(size // len(chunk)):
+            stream = sys.stdout if i % 2 else sys.stderr
+            stream.buffer.write(chunk)
+
+    runner = CliRunner()
+    tracemalloc.start()
+    try:
+        result = runner.invoke(cli)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert len(result.output_bytes) == size
+    assert peak < 2.5 * size
+    assert len(result.stdout_bytes) + len(result.stderr_bytes) == size
+
+
+def test_stderr_interleaved():
+    def cli():
+        print("one")
+        sys.stdout.flush()
+        print("two", file=sys.stderr, flush=True)
+        print("three")
+
+    runner = CliRunner()
+    result = runner.invoke(cli)
+    assert result.output == "one\ntwo\nthree\n"
+    assert result.stdout == "one\nthree\n"
+    assert result.stderr == "two\n"
+
+
+def test_capture_spool():
+    def cli():
+        print("a" * 100)
+        sys.stdout.flush()
+        print("b" * 100, file=sys.stderr, flush=True)
+        print("needle")
+
+    runner = CliRunner(capture="spool", spool_threshold=64)
+    result = runner.invoke(cli)
+    assert result.exit_code == 0
+    assert isinstance(result.output_bytes, CapturedBytes)
+    assert isinstance(result.output_bytes._data, mmap.mmap)
+    assert result.stdout_bytes == b"a" * 100 + b"\nneedle\n"
+    assert result.stderr_bytes == b"b" * 100 + b"\n"
+    assert b"needle" in result.output_bytes
+    assert result.output == "a" * 100 + "\n" + "b" * 100 + "\nneedle\n"
+    assert result.stderr == "b" * 100 + "\n"
+
+
+def test_capture_spool_below_threshold():
+    def cli():
+        print("small")
+
+    runner = CliRunner(capture="spool")
+    result = runner.invoke(cli)
+    assert result.stdout_bytes == b"small\n"
+    assert result.stdout_bytes.startswith(b"sma")
+    assert len(result.output_bytes) == 6
+    assert result.output == "small\n"
+
+
+def test_capture_invalid():
+    with pytest.raises(ValueError):
+        CliRunner(capture="disk")
+
+
+def test_captured_bytes():
+    data = CapturedBytes(b"xxhello worldxx", 2, 13)
+    assert data == b"hello world"
+    assert len(data) == 11
+    assert data.find(b"world") == 6
+    assert data.find(b"xx") == -1
+    assert b"lo w" in data
+    assert ord("h") in data
+    assert data[0] == ord("h")
+    assert data[-5:] == b"world"
+    assert data.decode("utf-8") == "hello world"
+    assert bytes(data) == b"hello world"
+    assert data.upper() == b"HELLO WORLD"
+
+
+def test_zero_copy():
+    def cli():
+        print("hello world")
+        sys.stdout.flush()
+        print("error 42", file=sys.stderr)
+
+    runner = CliRunner(zero_copy=True)
+    result = runner.invoke(cli)
+    assert isinstance(result.stdout_bytes, CapturedBytes)
+    # the views share the capture buffer
+    assert result.stdout_bytes._data is result.output_bytes._data
+    assert result.stdout_bytes == b"hello world\n"
+    assert result.stderr_bytes == b"error 42\n"
+    assert b"world" in result.output_bytes
+    assert result.output == "hello world\nerror 42\n"
+
+    match = result.stderr_bytes.search(rb"error (\d+)")
+    assert match is not None
+    assert match.group(1) == b"42"
+    assert match.start() == 0
+    assert [m.group() for m in result.output_bytes.finditer(rb"\w+o")] == [
+        b"hello",
+        b"wo",
+        b"erro",
+    ]
+
+
+def test_result_text_cached():
+    def cli():
+        print("hello")
+
+    runner = CliRunner()
+    result = runner.invoke(cli)
+    assert result.output is result.output
+    assert result.stdout is result.stdout
+
+    # changing the charset or the bytes invalidates the cached text
+    runner.charset = "utf-16"
+    assert result.output != "hello\n"
+    runner.charset = "utf-8"
+    result.output_bytes = b"bye\r\n"
+    assert result.output == "bye\n"
+
+
+def test_result_lines(monkeypatch):
+    monkeypatch.setattr("clirunner.testing._LINE_CHUNK_SIZE", 3)
+
+    def cli():
+        sys.stdout.write("one\r\ntwo\r\nété\nlast")
+        sys.stdout.flush()
+        sys.stderr.write("err\n")
+
+    runner = CliRunner()
+    result = runner.invoke(cli)
+    assert result.lines() == ["one", "two", "été", "lasterr"]
+    assert list(result.iter_lines("stdout", keepends=True)) == [
+        "one\n",
+        "two\n",
+        "été\n",
+        "last",
+    ]
+    assert result.lines("stderr") == result.stderr.splitlines()
+    with pytest.raises(ValueError):
+        result.lines("stdin")
+
+    result = runner.invoke(lambda: sys.stdout.write("x" * 100 + "\r\ny\r"))
+    assert result.lines() == ["x" * 100, "y\r"]
+
+
+def test_concurrent_invoke():
+    """Invocations in several threads at once are isolated from each other."""
+    barrier = threading.Barrier(8)
+
+    def cli():
+        argparser = argparse.ArgumentParser()
+        argparser.add_argument("name")
+        args = argparser.parse_args()
+        barrier.wait(timeout=5)
+        line = sys.stdin.readline().strip()
+        print(f"{args.name} {os.environ['CLIRUNNER_NAME']} {line}")
+        print(args.name, file=sys.stderr)
+        os.environ["CLIRUNNER_LEAK"] = "1"
+
+    runner = CliRunner(concurrent=True)
+    stdout, argv, environ = sys.stdout, sys.argv, os.environ
+
+    def run(i):
+        return runner.invoke(
+            cli, [f"cli{i}"], input=f"input{i}\n", env={"CLIRUNNER_NAME": f"env{i}"}
+        )
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(run, range(8)))
+
+    for i, result in enumerate(results):
+        assert result.exit_code == 0
+        assert result.stdout == f"cli{i} env{i} input{i}\n"
+        assert result.stderr == f"cli{i}\n"
+
+    assert sys.stdout is stdout
+    assert sys.argv is argv
+    assert os.environ is environ
+    assert "CLIRUNNER_LEAK" not in os.environ
+
+
+def test_invoke_many():
+    runner = CliRunner()
+    results = runner.invoke_many(
+        hello, [["--name", f"name{i}"] for i in range(10)] + ["--bad"], workers=2
+    )
+    assert [r.output for r in results[:-1]] == [f"Hello name{i}!\n" for i in range(10)]
+    assert results[-1].exit_code == 2
+    assert isinstance(results[-1].exception, SystemExit)
+    assert results[-1].exc_info[2] is None
+    assert "unrecognized arguments: --bad" in results[-1].stderr
+
+
+def test_invoke_many_inputs():
+    runner = CliRunner(zero_copy=True)
+    results = runner.invoke_many(
+        prompt, [None, None], inputs=["one\n", "two\n"], mp_context="spawn"
+    )
+    assert [r.stdout for r in results] == ["Foo: foo = one\n", "Foo: foo = two\n"]
+
+    with pytest.raises(ValueError):
+        runner.invoke_many(prompt, [None, None], inputs=["one\n"])
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires os.fork")
+def test_fork():
+    runner = CliRunner(fork=True)
+    for _ in range(2):
+        result = runner.invoke(fork_cli)
+        assert result.exit_code == 0
+        assert result.output.startswith("counter=1 pid=")
+        assert result.runner is runner
+        assert f"pid={os.getpid()}" not in result.output
+
+    assert FORK_COUNTER == 0
+    assert "CLIRUNNER_FORKED" not in os.environ
+    assert "clirunner_fork_dummy" not in sys.modules
+
+    result = runner.invoke(hello, ["--bad"])
+    assert result.exit_code == 2
+    assert isinstance(result.exception, SystemExit)
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires os.fork")
+def test_fork_current_state(monkeypatch):
+    """Children of the zygote see the current directory and environment."""
+    runner = CliRunner(fork=True)
+    runner.invoke(fork_cli)
+    monkeypatch.setenv("CLIRUNNER_FORK_VALUE", "patched")
+    with runner.isolated_filesystem() as path:
+        result = runner.invoke(fork_write_cli)
+        assert result.output == "patched\n"
+        assert os.path.exists(os.path.join(path, "written.txt"))
+
+
+@pytest.mark.skipif(not hasattr(os, "waitid"), reason="requires os.waitid")
+def test_fork_zygote_killed():
+    """A zygote that died is replaced by the next invocation."""
+    from clirunner import _fork
+
+    runner = CliRunner(fork=True)
+    assert runner.invoke(fork_cli).exit_code == 0
+    pid = _fork._zygote._pid
+    os.kill(pid, signal.SIGKILL)
+    # wait until it is dead, leaving it to be reaped by the runner
+    os.waitid(os.P_PID, pid, os.WEXITED | os.WNOWAIT)
+    result = runner.invoke(fork_cli)
+    assert result.exit_code == 0
+    assert result.output.startswith("counter=1 ")
+    assert runner.invoke(fork_cli).exit_code == 0
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires os.fork")
+def test_fork_closure():
+    state = []
+
+    def cli():
+        state.append(1)
+        print(len(state))
+        raise ValueError("boom")
+
+    runner = CliRunner(fork=True)
+    result = runner.invoke(cli)
+    assert result.output == "1\n"
+    assert isinstance(result.exception, ValueError)
+    assert state == []
+
+    with pytest.raises(ValueError):
+        runner.invoke(cli, catch_exceptions=False)
+
+    def crash():
+        os._exit(3)
+
+    result = runner.invoke(crash)
+    assert result.exit_code == 3
+    assert isinstance(result.exception, ChildProcessError)
+
+
+def test_ainvoke():
+    async def cli():
+        argparser = argparse.ArgumentParser()
+        argparser.add_argument("name")
+        args = argparser.parse_args()
+        line = sys.stdin.readline().strip()
+        await asyncio.sleep(0.01)
+        print(f"{args.name} {os.environ['CLIRUNNER_NAME']} {line}")
+        return 0
+
+    async def main():
+        return await asyncio.gather(
+            *(
+                runner.ainvoke(
+                    cli,
+                    [f"cli{i}"],
+                    input=f"input{i}\n",
+                    env={"CLIRUNNER_NAME": f"env{i}"},
+                )
+                for i in range(5)
+            )
+        )
+
+    runner = CliRunner()
+    stdout = sys.stdout
+    results = asyncio.run(main())
+    assert [r.output for r in results] == [f"cli{i} env{i} input{i}\n" for i in range(5)]
+    assert all(r.exit_code == 0 for r in results)
+    assert sys.stdout is stdout
+    assert "CLIRUNNER_NAME" not in os.environ
+
+
+def test_ainvoke_exit_code():
+    async def cli():
+        await asyncio.sleep(0)
+        print("failed")
+        return 3
+
+    def sync_cli():
+        raise ValueError("boom")
+
+    runner = CliRunner()
+    result = asyncio.run(runner.ainvoke(cli))
+    assert result.exit_code == 3
+    assert result.output == "failed\n"
+
+    result = asyncio.run(runner.ainvoke(sync_cli))
+    assert result.exit_code == 1
+    assert isinstance(result.exception, ValueError)
+
+
+def test_ainvoke_options():
+    async def cli():
+        await asyncio.sleep(0)
+        print("one")
+        print("two")
+
+    chunks = []
+    runner = CliRunner()
+    result = asyncio.run(
+        runner.ainvoke(cli, on_output=lambda stream, chunk: chunks.append(chunk))
+    )
+    assert result.output == "one\ntwo\n"
+    assert chunks == [b"one\n", b"two\n"]
+
+    for option in ("timeout", "profile"):
+        with pytest.raises(TypeError, match=option):
+            asyncio.run(runner.ainvoke(cli, **{option: 1}))
+
+
+def test_metrics():
+    def cli():
+        print("x" * 100)
+        sys.stdout.flush()
+        print("error", file=sys.stderr)
+        time.sleep(0.01)
+
+    runner = CliRunner()
+    result = runner.invoke(cli)
+    metrics = result.metrics
+    assert metrics.wall_time >= 0.01
+    assert metrics.user_time >= 0
+    assert metrics.system_time >= 0
+    assert metrics.bytes_written == {"stdout": 101, "stderr": 6}
+    assert metrics.write_calls == {"stdout": 1, "stderr": 1}
+    assert metrics.peak_memory is None
+
+
+def test_metrics_trace_memory():
+    def cli():
+        data = bytearray(1024 * 1024)
+        print(len(data))
+
+    runner = CliRunner(trace_memory=True)
+    result = runner.invoke(cli)
+    assert result.metrics.peak_memory >= 1024 * 1024
+    assert not tracemalloc.is_tracing()
+
+
+def _spin_forever():
+    while True:
+        try:
+            # a call, so the loop can be interrupted on Python 3.10 as well
+            time.sleep(0.001)
+        except Exception:
+            pass
+
+
+def test_timeout():
+    def cli():
+        print("started")
+        _spin_forever()
+
+    runner = CliRunner()
+    stdout = sys.stdout
+    result = runner.invoke(cli, timeout=0.1)
+    assert result.exit_code == 1
+    assert isinstance(result.exception, TimeoutError)
+    assert isinstance(result.exception, InvocationTimeout)
+    assert "_spin_forever" in result.exception.stack
+    assert "_spin_forever" in str(result.exception)
+    assert result.output == "started\n"
+    assert sys.stdout is stdout
+
+    with pytest.raises(InvocationTimeout):
+        runner.invoke(cli, timeout=0.1, catch_exceptions=False)
+
+    result = runner.invoke(hello, timeout=5)
+    assert result.exit_code == 0
+    time.sleep(0.01)
+
+
+@pytest.mark.skipif(not hasattr(signal, "setitimer"), reason="requires setitimer")
+def test_timeout_restores_outer_timer():
+    signal.setitimer(signal.ITIMER_REAL, 30)
+    try:
+        CliRunner().invoke(hello, timeout=5)
+        remaining, _ = signal.getitimer(signal.ITIMER_REAL)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+    assert 25 < remaining <= 30
+
+
+def test_timeout_in_thread():
+    def cli():
+        print("started")
+        _spin_forever()
+
+    runner = CliRunner(concurrent=True)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results = list(executor.map(lambda _: runner.invoke(cli, timeout=0.1), range(2)))
+    for result in results:
+        assert isinstance(result.exception, InvocationTimeout)
+        assert "_spin_forever" in result.exception.stack
+        assert result.output == "started\n"
+
+
+def test_on_output():
+    def cli():
+        for i in range(3):
+            print(f"line {i}")
+        print("warning", file=sys.stderr)
+        sys.stdout.write("no newline")
+
+    chunks = []
+    runner = CliRunner()
+    result = runner.invoke(cli, on_output=lambda *args: chunks.append(args))
+    assert result.exit_code == 0
+    assert chunks == [
+        ("stdout", b"line 0\n"),
+        ("stdout", b"line 1\n"),
+        ("stdout", b"line 2\n"),
+        ("stderr", b"warning\n"),
+        ("stdout", b"no newline"),
+    ]
+    assert result.output == "line 0\nline 1\nline 2\nwarning\nno newline"
+
+
+def test_on_output_abort():
+    progress = []
+
+    def cli():
+        for i in range(1000):
+            progress.append(i)
+            print(f"line {i}")
+            if i == 5:
+                print("FATAL: broken", file=sys.stderr)
+
+    runner = CliRunner()
+    result = runner.invoke(
+        cli, on_output=lambda stream, chunk: chunk.startswith(b"FATAL")
+    )
+    assert progress == list(range(6))
+    assert result.exit_code == 1
+    assert isinstance(result.exception, InvocationAborted)
+    assert result.exception.stream == "stderr"
+    assert result.exception.chunk == b"FATAL: broken\n"
+    assert result.output.endswith("line 5\nFATAL: broken\n")
+
+    with pytest.raises(ValueError):
+        CliRunner(fork=True).invoke(cli, on_output=print)
+
+    def swallowing_cli():
+        try:
+            print("FATAL: broken")
+        except BaseException:
+            pass
+        sys.exit(0)
+
+    result = runner.invoke(
+        swallowing_cli, on_output=lambda stream, chunk: chunk.startswith(b"FATAL")
+    )
+    assert result.exit_code == 1
+    assert isinstance(result.exception, InvocationAborted)
+
+
+def test_iterable_input():
+    produced = []
+
+    def chunks():
+        for i in range(1000):
+            produced.append(i)
+            yield f"line {i}\n" if i % 2 else f"line {i}\n".encode()
+
+    def cli():
+        print(sys.stdin.readline(), end="")
+        print(sys.stdin.readline(), end="")
+
+    runner = CliRunner()
+    result = runner.invoke(cli, input=chunks())
+    assert result.output == "line 0\nline 1\n"
+    # chunks are only produced as stdin is read
+    assert len(produced) < 1000
+
+    def cat():
+        for line in sys.stdin:
+            print(line.upper(), end="")
+
+    result = runner.invoke(cat, input=["a", "b\nc", "", "\n"])
+    assert result.output == "AB\nC\n"
+
+    result = CliRunner(echo_stdin=True).invoke(prompt, input=iter([b"wau ", b"wau\n"]))
+    assert result.output == "Foo: wau wau\nfoo = wau wau\n"
+
+
+def test_async_iterable_input():
+    produced = []
+
+    async def chunks():
+        for i in range(1000):
+            produced.append(i)
+            await asyncio.sleep(0)
+            yield f"line {i}\n"
+
+    async def cli():
+        print(sys.stdin.readline(), end="")
+        print(sys.stdin.readline(), end="")
+
+    runner = CliRunner()
+    result = asyncio.run(runner.ainvoke(cli, input=chunks()))
+    assert result.output == "line 0\nline 1\n"
+    assert len(produced) < 100
+
+    async def failing():
+        yield "ok\n"
+        raise RuntimeError("input failed")
+
+    def cat():
+        print(sys.stdin.read())
+
+    result = runner.invoke(cat, input=failing())
+    assert isinstance(result.exception, RuntimeError)
+
+
+def test_file_input(tmp_path):
+    path = tmp_path / "input.txt"
+    path.write_bytes(b"first line\nsecond line\n" + b"x" * 100_000 + b"\nlast")
+
+    def cli():
+        print(sys.stdin.readline(), end="")
+        data = sys.stdin.read()
+        print(len(data))
+
+    runner = CliRunner()
+    for input in (path, FileInput(path), FileInput(str(path))):
+        result = runner.invoke(cli, input=input)
+        assert result.exit_code == 0
+        assert result.output == f"first line\n{12 + 100_000 + 5}\n"
+
+    def cat():
+        for line in sys.stdin:
+            print(line, end="")
+
+    result = runner.invoke(cat, input=path)
+    assert result.output_bytes == path.read_bytes()
+
+    empty = tmp_path / "empty.txt"
+    empty.write_bytes(b"")
+    result = runner.invoke(cat, input=empty)
+    assert result.output == ""
+
+
+def test_mapped_file_input(tmp_path):
+    path = tmp_path / "input.bin"
+    path.write_bytes(b"0123456789\nabc")
+    stream = make_input_stream(FileInput(path), "utf-8")
+    assert stream.read(3) == b"012"
+    buffer = bytearray(4)
+    assert stream.readinto(buffer) == 4
+    assert buffer == b"3456"
+    assert stream.readline() == b"789\n"
+    assert stream.tell() == 11
+    assert stream.readline(2) == b"ab"
+    assert stream.read() == b"c"
+    assert stream.read() == b""
+    assert stream.seek(-3, io.SEEK_END) == 11
+    assert stream.read1(10) == b"abc"
+    stream.close()
+    with pytest.raises(ValueError):
+        stream.read()
+
+
+def test_echo_stdin_text_reads():
+    def cli():
+        first = sys.stdin.readline()
+        print(f"first={first.strip()}")
+        second = next(sys.stdin)
+        print(f"second={second.strip()}")
+        rest = sys.stdin.readlines()
+        print(f"rest={len(rest)}")
+
+    runner = CliRunner(echo_stdin=True)
+    result = runner.invoke(cli, input="one\ntwo\nthree\nfour\n")
+    assert result.output == (
+        "one\nfirst=one\ntwo\nsecond=two\nthree\nfour\nrest=2\n"
+    )
+
+
+def test_echo_stdin_large_input():
+    data = "x" * 99 + "\n"
+
+    def cli():
+        print(len(sys.stdin.read()))
+
+    runner = CliRunner(echo_stdin=True)
+    start = time.perf_counter()
+    result = runner.invoke(cli, input=data * 100_000)
+    assert time.perf_counter() - start < 5
+    assert result.output == data * 100_000 + "10000000\n"
+    # text is read in large chunks rather than one byte at a time
+    assert result.metrics.write_calls["stdout"] < 100
+
+
+def test_interact():
+    def cli():
+        name = input("Name: ")
+        sys.stdout.write("Age: ")
+        age = int(sys.stdin.readline())
+        if age < 18:
+            print(f"Sorry {name}")
+            return 1
+        print(f"Welcome {name}")
+        answer = input("Continue? [y/n] ")
+        print(f"answer={answer}")
+
+    runner = CliRunner()
+    with runner.interact(cli, timeout=5) as session:
+        session.expect("Name: ")
+        session.sendline("Alice")
+        session.expect(r"Age: $")
+        session.sendline("42")
+        match = session.expect(r"Welcome (\w+)")
+        assert match.group(1) == "Alice"
+        session.expect(r"\[y/n\] ")
+        assert session.before == "\nContinue? "
+        session.sendline("y")
+        session.expect("answer=y")
+    result = session.wait()
+    assert result.exit_code == 0
+    assert result.output == "Name: Age: Welcome Alice\nContinue? [y/n] answer=y\n"
+
+    session = runner.interact(cli, timeout=5)
+    session.expect("Name: ")
+    session.sendline("Bob")
+    session.sendline("12")
+    with pytest.raises(EOFError):
+        session.expect("Welcome")
+    result = session.wait()
+    assert result.exit_code == 1
+    assert result.output == "Name: Age: Sorry Bob\n"
+
+
+def test_interact_timeout():
+    runner = CliRunner()
+    session = runner.interact(prompt, timeout=0.1)
+    with pytest.raises(TimeoutError):
+        session.expect("never")
+    assert session.output == "Foo: "
+    result = session.wait()
+    assert isinstance(result.exception, EOFError)
+
+
+CACHE_CALLS = []
+
+
+def cached_cli():
+    CACHE_CALLS.append(sys.argv[1:])
+    name = os.environ.get("NAME", "World")
+    print(f"Hello {name} {sys.stdin.read()}")
+
+
+def test_cache():
+    cache = ResultCache()
+    runner = CliRunner(cache=cache)
+    CACHE_CALLS.clear()
+    first = runner.invoke(cached_cli, ["--help"])
+    second = runner.invoke(cached_cli, ["--help"])
+    assert second is not first
+    assert second.output == first.output
+    assert CACHE_CALLS == [["--help"]]
+    assert (cache.hits, cache.misses, len(cache)) == (1, 1, 1)
+
+    # any difference in args, input or env is a different invocation
+    assert runner.invoke(cached_cli, ["--version"]) is not first
+    assert runner.invoke(cached_cli, ["--help"], input="x").output == "Hello World x\n"
+    assert runner.invoke(cached_cli, ["--help"], env={"NAME": "Al"}).output == (
+        "Hello Al \n"
+    )
+    assert CliRunner(cache=cache, env={"NAME": "Al"}).invoke(
+        cached_cli, ["--help"]
+    ).output == "Hello Al \n"
+    assert len(CACHE_CALLS) == 4
+
+    # so is a runner recording different metrics
+    traced = CliRunner(cache=cache, trace_allocations=True)
+    assert traced.invoke(cached_cli, ["--help"]).allocations is not None
+    assert len(CACHE_CALLS) == 5
+
+    # streams are consumed by the command, so are never cached
+    runner.invoke(cached_cli, ["--help"], input=BytesIO(b"x"))
+    runner.invoke(cached_cli, ["--help"], input=BytesIO(b"x"))
+    assert len(CACHE_CALLS) == 7
+
+    # closures are keyed by identity
+    def make_cli(greeting):
+        def cli():
+            print(greeting)
+
+        return cli
+
+    assert runner.invoke(make_cli("hi")).output == "hi\n"
+    assert runner.invoke(make_cli("ho")).output == "ho\n"
+
+    if hasattr(os, "fork"):
+        hits = cache.hits
+        forked = CliRunner(fork=True, cache=cache)
+        assert forked.invoke(hello).output == "Hello World!\n"
+        assert forked.invoke(hello).output == "Hello World!\n"
+        assert cache.hits == hits + 1
+
+    # hits are copies for the runner, without the traceback of the failure
+    def fails():
+        raise ValueError("boom")
+
+    failed = runner.invoke(fails)
+    assert failed.exc_info[2] is not None
+    other = CliRunner(cache=cache)
+    hit = other.invoke(fails)
+    assert hit.runner is other
+    assert isinstance(hit.exception, ValueError)
+    assert hit.exception is not failed.exception
+    assert hit.exception.__traceback__ is None and hit.exc_info[2] is None
+
+    cache.clear()
+    assert len(cache) == 0
+    assert CliRunner(cache=False).cache is None
+    assert CliRunner(cache=True).cache is CliRunner(cache=True).cache
+
+
+def test_cache_limits():
+    cache = ResultCache(maxsize=2, max_bytes=100)
+    runner = CliRunner(cache=cache)
+
+    def cli():
+        print("x" * int(sys.argv[1]))
+
+    for size in ("1", "2", "3"):
+        runner.invoke(cli, [size])
+    assert len(cache) == 2
+    runner.invoke(cli, ["1"])
+    assert cache.hits == 0
+
+    # too large for the cache
+    runner.invoke(cli, ["120"])
+    assert cache.nbytes <= 100
+    runner.invoke(cli, ["120"])
+    assert cache.hits == 0
+
+    def fails():
+        raise SystemExit(3)
+
+    timed_out = runner.invoke(_spin_forever, timeout=0.05)
+    assert timed_out.exception is not None
+    assert runner.invoke(_spin_forever, timeout=0.05) is not timed_out
+    assert runner.invoke(fails).exit_code == 3
+    assert runner.invoke(fails).exit_code == 3
+    assert cache.hits == 1
+
+
+def test_disk_cache(tmp_path, monkeypatch):
+    module = tmp_path / "cached_module.py"
+    module.write_text("def cli():\n    print('one')\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delitem(sys.modules, "cached_module", raising=False)
+    import cached_module
+
+    directory = tmp_path / "cache"
+    cache = DiskResultCache(directory)
+    runner = CliRunner(cache=cache)
+    assert runner.invoke(cached_module.cli, ["a"]).output == "one\n"
+    assert cache.misses == 1
+
+    # a new cache on the same directory, as in a later test session
+    cache = DiskResultCache(directory)
+    runner = CliRunner(cache=cache)
+    result = runner.invoke(cached_module.cli, ["a"])
+    assert result.output == "one\n"
+    assert result.runner is runner
+    assert (cache.hits, cache.misses) == (1, 0)
+
+    # editing the source of the module invalidates its results
+    module.write_text("def cli():\n    print('two')\n")
+    result = runner.invoke(cached_module.cli, ["a"])
+    assert cache.misses == 1
+
+    # functions defined in other functions are never stored
+    def local():
+        CACHE_CALLS.append(None)
+
+    CACHE_CALLS.clear()
+    runner.invoke(local)
+    runner.invoke(local)
+    assert len(CACHE_CALLS) == 2
+
+    cache.clear()
+    assert not directory.exists()
+
+
+def test_disk_cache_dependencies(tmp_path, monkeypatch):
+    package = tmp_path / "cached_pkg"
+    package.mkdir()
+    (package / "__init__.py").write_text("")
+    (package / "consts.py").write_text("GREETING = 'hello'\n")
+    (package / "helpers.py").write_text("def shout(s):\n    return s.upper()\n")
+    (package / "main.py").write_text(
+        "from .consts import GREETING\n"
+        "\n"
+        "def cli():\n"
+        "    from cached_pkg import helpers\n"
+        "    print(helpers.shout(GREETING))\n"
+    )
+    monkeypatch.syspath_prepend(str(tmp_path))
+    for name in ("consts", "helpers", "main"):
+        monkeypatch.delitem(sys.modules, f"cached_pkg.{name}", raising=False)
+    monkeypatch.delitem(sys.modules, "cached_pkg", raising=False)
+    from cached_pkg import main
+
+    runner = CliRunner(cache=DiskResultCache(tmp_path / "cache"))
+    assert runner.invoke(main.cli).output == "HELLO\n"
+    assert runner.invoke(main.cli).output == "HELLO\n"
+    assert runner.cache.hits == 1
+
+    # constants and modules imported inside functions are dependencies too
+    (package / "consts.py").write_text("GREETING = 'bye'\n")
+    runner.invoke(main.cli)
+    assert runner.cache.hits == 1
+    (package / "helpers.py").write_text("def shout(s):\n    return s\n")
+    runner.invoke(main.cli)
+    assert runner.cache.hits == 1
+
+
+def test_disk_cache_files(tmp_path):
+    cache = DiskResultCache(tmp_path / "cache", include_files=True)
+    runner = CliRunner(cache=cache)
+    with runner.isolated_filesystem():
+        assert runner.invoke(hello).output == "Hello World!\n"
+        assert runner.invoke(hello).output == "Hello World!\n"
+        assert cache.hits == 1
+        with open("data.txt", "w") as f:
+            f.write("data")
+        runner.invoke(hello)
+        assert cache.hits == 1
+
+
+def test_disk_cache_limit(tmp_path):
+    cache = DiskResultCache(tmp_path, max_bytes=2000)
+    runner = CliRunner(cache=cache)
+    for name in ("a" * 400, "b" * 400, "c" * 400):
+        runner.invoke(hello, ["--name", name])
+    stored = [path for path in tmp_path.rglob("*.pickle")]
+    assert 0 < len(stored) < 3
+    assert sum(path.stat().st_size for path in stored) <= 2000
+
+
+def test_disk_cache_walks(tmp_path, monkeypatch):
+    """The cache directory is only walked once, until it is over the limit."""
+    walks = []
+    walk = os.walk
+    monkeypatch.setattr(os, "walk", lambda *args: walks.append(args) or walk(*args))
+    cache = DiskResultCache(tmp_path)
+    runner = CliRunner(cache=cache)
+    for name in ("a", "b", "c"):
+        runner.invoke(hello, ["--name", name])
+    assert len(walks) == 1
+
+    cache.max_bytes = sum(path.stat().st_size for path in tmp_path.rglob("*.pickle"))
+    runner.invoke(hello, ["--name", "d"])
+    assert len(walks) == 2
+    assert len(list(tmp_path.rglob("*.pickle"))) == 3
+
+
+def test_isolated_filesystem_template(tmp_path):
+    template = tmp_path / "template"
+    (template / "sub").mkdir(parents=True)
+    (template / "a.txt").write_text("a")
+    (template / "sub" / "b.txt").write_text("b")
+
+    runner = CliRunner()
+    with runner.isolated_filesystem(template=template) as d:
+        assert sorted(os.listdir(d)) == ["a.txt", "sub"]
+        with open("sub/b.txt") as f:
+            assert f.read() == "b"
+        with open("a.txt", "w") as f:
+            f.write("changed")
+    assert not os.path.exists(d)
+    assert (template / "a.txt").read_text() == "a"
+
+    with runner.isolated_filesystem(template=str(template), hardlink=True):
+        # hard linked where the system temporary directory has no reflinks
+        if os.stat(".").st_dev in _fs._no_reflink:
+            assert os.path.samefile("a.txt", template / "a.txt")
+        with open("a.txt") as f:
+            assert f.read() == "a"
+
+
+def test_isolated_filesystem_golden_template():
+    builds = []
+
+    def build(directory):
+        builds.append(directory)
+        with open(os.path.join(directory, "config.ini"), "w") as f:
+            f.write("[app]\n")
+
+    runner = CliRunner()
+    for _ in range(3):
+        with runner.isolated_filesystem(template=build) as d:
+            assert os.listdir(d) == ["config.ini"]
+            os.remove("config.ini")
+    assert len(builds) == 1
+    assert os.listdir(builds[0]) == ["config.ini"]
+
+    def broken(directory):
+        raise RuntimeError("broken")
+
+    with pytest.raises(RuntimeError):
+        with runner.isolated_filesystem(template=broken):
+            pass
+
+
+def test_isolated_filesystem_memory(tmp_path):
+    runner = CliRunner(filesystem="memory", memory_dir=tmp_path, memory_min_free=0)
+    with runner.isolated_filesystem() as d:
+        assert os.path.dirname(d) == str(tmp_path)
+    assert not os.path.exists(d)
+
+    # fall back to the system temporary directory
+    for runner in (
+        CliRunner(filesystem="memory", memory_dir=tmp_path, memory_min_free=2**62),
+        CliRunner(filesystem="memory", memory_dir=tmp_path / "missing"),
+    ):
+        with runner.isolated_filesystem() as d:
+            assert os.path.dirname(d) == tempfile.gettempdir()
+
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        runner = CliRunner(filesystem="memory", memory_min_free=0)
+        with runner.isolated_filesystem() as d:
+            assert os.path.dirname(d) == "/dev/shm"
+
+    with pytest.raises(ValueError):
+        CliRunner(filesystem="ram")
+
+
+def test_isolated_filesystem_cleanup(tmp_path):
+    runner = CliRunner(filesystem="memory", memory_dir=tmp_path, memory_min_free=0)
+    for _ in range(3):
+        with runner.isolated_filesystem() as d:
+            os.makedirs("a/b/c")
+            with open("a/b/c/file.txt", "w") as f:
+                f.write("data")
+        # renamed away before the block exits
+        assert not os.path.exists(d)
+    (trash,) = os.listdir(tmp_path)
+    assert trash.startswith(".clirunner-trash-")
+    if not WIN:
+        assert stat.S_IMODE(os.stat(tmp_path / trash).st_mode) == 0o700
+    _fs.trash.flush()
+    assert os.listdir(tmp_path) == []
+
+    runner = CliRunner(cleanup="sync")
+    with runner.isolated_filesystem() as d:
+        pass
+    assert not os.path.exists(d)
+
+    with pytest.raises(ValueError):
+        CliRunner(cleanup="later")
+
+
+def test_bench():
+    calls = []
+
+    def cli():
+        calls.append(sys.stdin.read())
+        return [0] * 10000
+
+    runner = CliRunner()
+    stats = runner.bench(cli, input="data", rounds=5, warmup=2)
+    assert calls == ["data"] * 8
+    assert stats.rounds == 5
+    assert 0 < stats.min <= stats.median <= stats.p95 <= stats.max
+    assert stats.stddev >= 0
+    assert stats.ops_per_sec == pytest.approx(1 / stats.mean)
+    assert stats.peak_memory >= 80000
+    assert "5 rounds" in str(stats)
+
+    stats = runner.bench(cli, rounds=1, warmup=0, memory=False)
+    assert stats.stddev == 0
+    assert stats.p95 == stats.min
+    assert stats == BenchmarkStats(stats.times)
+    assert repr(stats) == f"BenchmarkStats(times={stats.times!r}, peak_memory=None)"
+    assert stats.peak_memory is None
+
+    with pytest.raises(ValueError):
+        runner.bench(cli, input=BytesIO(b"data"))
+    with pytest.raises(ValueError):
+        runner.bench(cli, rounds=0)
+    with pytest.raises(ZeroDivisionError):
+        runner.bench(lambda: 1 / 0, rounds=1)
+
+
+def _fib(n):
+    return n if n < 2 else _fib(n - 1) + _fib(n - 2)
+
+
+def profiled_cli():
+    print(_fib(15))
+
+
+def test_profile(tmp_path):
+    runner = CliRunner()
+    result = runner.invoke(profiled_cli, profile=True)
+    assert result.output == "610\n"
+    profile = result.profile
+    assert "_fib" in profile.text(sort="tottime", limit=5)
+    assert profile.total_time > 0
+    # only the command is profiled, not the harness
+    assert "_isolation" not in profile.text(limit=None)
+
+    lines = profile.collapsed().splitlines()
+    assert lines
+    for line in lines:
+        stack, micros = line.rsplit(" ", 1)
+        assert int(micros) > 0
+    assert all(line.startswith("profiled_cli ") for line in lines)
+    assert any("_fib" in line for line in lines)
+
+    profile.dump(tmp_path / "out.pstats")
+    assert pstats.Stats(str(tmp_path / "out.pstats")).total_calls > 0
+    profile.dump_collapsed(tmp_path / "out.folded")
+    assert (tmp_path / "out.folded").read_text() == profile.collapsed()
+
+    # failing commands are profiled too
+    result = runner.invoke(lambda: 1 / 0, profile="cprofile")
+    assert isinstance(result.exception, ZeroDivisionError)
+    assert result.profile is not None
+
+    assert runner.invoke(profiled_cli).profile is None
+    with pytest.raises(ValueError):
+        runner.invoke(profiled_cli, profile="pyinstrument")
+
+
+def test_profile_callable():
+    entered = []
+
+    class Profiler:
+        def __enter__(self):
+            entered.append(sys.argv[:])
+            return self
+
+        def __exit__(self, *exc_info):
+            self.done = True
+
+    result = CliRunner().invoke(hello, ["--name", "Al"], profile=Profiler)
+    assert entered == [["hello", "--name", "Al"]]
+    assert isinstance(result.profile, Profiler) and result.profile.done
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires os.fork")
+def test_profile_fork():
+    result = CliRunner(fork=True).invoke(profiled_cli, profile=True)
+    assert "_fib" in result.profile.text()
+
+
+LEAKED = []
+
+
+def leaky_cli():
+    LEAKED.append(bytearray(1000))
+
+
+def test_trace_allocations():
+    runner = CliRunner(trace_allocations=True)
+    result = runner.invoke(leaky_cli)
+    allocations = result.allocations
+    assert allocations is result.metrics.allocations
+    assert allocations.net_bytes >= 1000
+    top = allocations.top(1)[0]
+    assert top.traceback[0].filename == __file__
+    assert top.size_diff >= 1000
+    assert "bytes in" in str(allocations)
+    assert not tracemalloc.is_tracing()
+
+    def clean_cli():
+        data = [bytearray(1000) for _ in range(100)]
+        print(len(data))
+
+    result = runner.invoke(clean_cli)
+    assert result.output == "100\n"
+    assert result.allocations.net_bytes < 1000
+
+    assert CliRunner().invoke(leaky_cli).allocations is None
+
+
+def test_assert_no_leak():
+    runner = CliRunner()
+    cache = {}
+
+    def cached_cli():
+        # filled once, during the warmup
+        cache.setdefault(sys.argv[1], bytearray(10000))
+        print(len(cache))
+
+    diff = runner.assert_no_leak(cached_cli, ["a"], iterations=20)
+    assert diff.net_bytes < 4096
+
+    with pytest.raises(AssertionError, match="leaky_cli|test_clirunner"):
+        runner.assert_no_leak(leaky_cli, iterations=20)
+    assert not tracemalloc.is_tracing()
+
+
+def test_lazy_import():
+    code = """
+import sys
+import clirunner
+assert "clirunner.testing" not in sys.modules
+from clirunner import CliRunner
+lazy = [
+    "asyncio",
+    "clirunner._cache",
+    "clirunner._compat",
+    "clirunner._fork",
+    "clirunner._profile",
+    "clirunner._winconsole",
+    "clirunner.exceptions",
+    "copy",
+    "dataclasses",
+    "inspect",
+    "mmap",
+    "queue",
+    "shlex",
+    "shutil",
+    "signal",
+    "tempfile",
+    "threading",
+]
+print(",".join(name for name in lazy if name in sys.modules))
+assert clirunner.testing.Result
+assert clirunner.exceptions.InvocationTimeout
+"""
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    assert output == "\n"
+
+    import clirunner
+
+    assert clirunner.CliRunner is CliRunner
+    assert clirunner.ResultCache is ResultCache
+    assert "FileInput" in dir(clirunner)
+    with pytest.raises(AttributeError):
+        clirunner.Missing